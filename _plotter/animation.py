@@ -1,25 +1,40 @@
+import argparse
+import concurrent.futures
 import math
-import matplotlib.animation as animation
-import matplotlib.pyplot as plt
+import os
 import os.path as path
+import shutil
+import subprocess
 import sys
+import zlib
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import numpy as np  # noqa: E402
+from PIL import Image  # noqa: E402
 
 
 STATES_FNAME = "states.csv"
 ACTIONS_FNAME = "actions.csv"
 REWARDS_FNAME = "rewards.csv"
+EPISODES_FNAME = "episodes.bin"  # recorder.EpisodeRecorder が書くファイル
 GIF_FNAME = "animation.gif"
+FRAMES_PER_SEC = 50
+
+EPISODES_MAGIC = b"ARLE"
+EPISODES_VERSION = 1
+EPISODES_HEADER = np.dtype([("magic", "S4"), ("version", "<u4"), ("steps", "<u4"),
+                            ("count", "<u4")])
 
 
 class Visualizer:
-    def __init__(self, states_fname, actions_fname, rewards_fname):
-        self.states_fname = states_fname
-        self.actions_fname = actions_fname
-        self.rewards_fname = rewards_fname
+    """artist は最初に 1 回だけつくり，フレームごとにデータだけ差し替えて blit する"""
 
+    def __init__(self, states, actions, rewards):
         self.cart_size = [1.0, 0.5]
         self.pole_len = 0.5
-        self.frames_per_sec = 50
+        self.frames_per_sec = FRAMES_PER_SEC
         self.tick = 1 / self.frames_per_sec
 
         # 図の出力範囲
@@ -34,50 +49,52 @@ class Visualizer:
         self.text_action_pos = [-2.8, 1.4]
         self.text_reward_pos = [-2.8, 1.2]
 
-        self.step = 0
-        self.time = 0
+        # s = [x, theta, xdot, thetadot]
+        self.states = states
+        self.actions = actions
+        self.rewards = rewards
 
         self.fig, self.ax = plt.subplots()
-        self.states = self.lines_to_state(self.readlines(self.states_fname))
-        self.actions = self.readlines(self.actions_fname)
-        self.rewards = self.readlines(self.rewards_fname)
-
-    def make_animation(self):
-        self.ani = animation.FuncAnimation(
-            self.fig,
-            self.update,
-            interval=int(self.tick * 1000),
-            frames=len(self.states)-1  # 読み込みの最後は空行なので -1 する
-        )
-
-    def save(self, fname):
-        self.ani.save(fname, writer="imagemagick")
-
-    def update(self, *args):
         self.init_axes()
-        s = self.states[self.step]
-        a = self.actions[self.step]
-        r = self.rewards[self.step]
-        self.draw_cart(s)
-        self.draw_pole(s)
-        self.draw_action_arrow(s, a)
-        self.write_info(s, a, r)
-        self.time += self.tick
-        self.step += 1
+        self.init_artists()
+
+        # 動かない部分 (軸など) を描いて背景として取っておく
+        self.fig.canvas.draw()
+        self.background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def frames_num(self):
+        return len(self.states)
 
     def init_axes(self):
-        self.ax.clear()
         self.ax.set_xlim(*self.xlim)
         self.ax.set_ylim(*self.ylim)
         self.ax.set_aspect("equal")
 
-    def readlines(self, fname):
-        with open(fname) as f:
-            return f.readlines()
+    def init_artists(self):
+        self.cart, = self.ax.plot([], [], color="black", linewidth=1, animated=True)
+        self.pole, = self.ax.plot([], [], animated=True)
+        self.arrow = self.ax.annotate(
+            "", xy=(0, 0), xytext=(0, 0), animated=True,
+            arrowprops=dict(arrowstyle="-|>", facecolor="orange", edgecolor="orange"))
+        self.texts = [self.ax.text(*pos, "", animated=True) for pos in [
+            self.text_time_pos,
+            self.text_x_pos,
+            self.text_xdot_pos,
+            self.text_theta_pos,
+            self.text_thetadot_pos,
+            self.text_action_pos,
+            self.text_reward_pos,
+        ]]
+        self.artists = [self.cart, self.pole, self.arrow] + self.texts
 
-    def lines_to_state(self, lines):
-        # s = [x, theta, xdot, thetadot]
-        return [list(map(float, line.strip().split(","))) for line in lines]
+    def update(self, step):
+        s = self.states[step]
+        a = self.actions[step]
+        r = self.rewards[step]
+        self.draw_cart(s)
+        self.draw_pole(s)
+        self.draw_action_arrow(s, a)
+        self.write_info(step * self.tick, s, a, r)
 
     def draw_cart(self, s):
         left = s[0] - self.cart_size[0]/2
@@ -85,10 +102,7 @@ class Visualizer:
         bottom = -self.cart_size[1]/2
         top = self.cart_size[1]/2
 
-        self.ax.hlines(bottom, left, right)
-        self.ax.hlines(top, left, right)
-        self.ax.vlines(left, bottom, top)
-        self.ax.vlines(right, bottom, top)
+        self.cart.set_data([left, right, right, left, left], [bottom, bottom, top, top, bottom])
 
     def draw_pole(self, s):
         x, theta = s[0], s[1]
@@ -98,49 +112,191 @@ class Visualizer:
         tip_x = axis_x + math.sin(theta)
         tip_y = math.cos(theta)
 
-        self.ax.plot([axis_x, tip_x], [axis_y, tip_y])
+        self.pole.set_data([axis_x, tip_x], [axis_y, tip_y])
 
     def draw_action_arrow(self, s, a):
         x = s[0]
-        a = float(a)
         if a == 0:
+            self.arrow.set_visible(False)
             return
         elif a > 0:
             start = [x + self.cart_size[0] / 2, 0]
-            end = [start[0] + a / 10, 0]
         else:
             start = [x - self.cart_size[0] / 2, 0]
-            end = [start[0] + a / 10, 0]
+        end = [start[0] + a / 10, 0]
 
-        self.ax.annotate("", xy=end, xytext=start,
-                         arrowprops=dict(arrowstyle="-|>", facecolor="orange", edgecolor="orange"))
+        self.arrow.set_visible(True)
+        self.arrow.xy = end
+        self.arrow.set_position(start)
 
-    def write_info(self, s, a, r):
+    def write_info(self, time, s, a, r):
         x, theta, xdot, thetadot = s
-        self.ax.text(*self.text_time_pos, f"time[s] = {self.time}")
-        self.ax.text(*self.text_x_pos, f"x[m] ={x}")
-        self.ax.text(*self.text_xdot_pos, f"xdot[m/s] ={xdot}")
-        self.ax.text(*self.text_theta_pos, f"theta[rad] = {theta}")
-        self.ax.text(*self.text_thetadot_pos, f"thetadot[rad/s] = {thetadot}")
-        self.ax.text(*self.text_action_pos, f"a = {a}")
-        self.ax.text(*self.text_reward_pos, f"r = {r}")
+        for text, value in zip(self.texts, [
+            f"time[s] = {time:.2f}",
+            f"x[m] ={x}",
+            f"xdot[m/s] ={xdot}",
+            f"theta[rad] = {theta}",
+            f"thetadot[rad/s] = {thetadot}",
+            f"a = {a}",
+            f"r = {r}",
+        ]):
+            text.set_text(value)
+
+    def render(self, step):
+        """step 番目のフレームを描いて RGB の Image を返す"""
+        canvas = self.fig.canvas
+        self.update(step)
+        canvas.restore_region(self.background)
+        for artist in self.artists:
+            self.ax.draw_artist(artist)
+        return Image.frombuffer("RGBA", canvas.get_width_height(), canvas.buffer_rgba()) \
+            .convert("RGB")
+
+
+def load_csv(lang_dir):
+    """test エピソードの (states, actions, rewards)"""
+    return (np.loadtxt(path.join(lang_dir, STATES_FNAME), delimiter=",", ndmin=2),
+            np.loadtxt(path.join(lang_dir, ACTIONS_FNAME), ndmin=1),
+            np.loadtxt(path.join(lang_dir, REWARDS_FNAME), ndmin=1))
+
+
+def load_episodes(fname):
+    """EpisodeRecorder が残したエピソードを構造化配列 (memmap) として読む
+
+    フィールドは episode, flags, return, states (steps, 4), actions (steps,), rewards (steps,)
+    """
+    header = np.fromfile(fname, dtype=EPISODES_HEADER, count=1)[0]
+    if header["magic"] != EPISODES_MAGIC or header["version"] != EPISODES_VERSION:
+        raise ValueError(f"not an episodes file (version {EPISODES_VERSION}): {fname}")
+    steps = int(header["steps"])
+    record = np.dtype([("episode", "<u8"), ("flags", "<u8"), ("return", "<f8"),
+                       ("states", "<f8", (steps, 4)), ("actions", "<f8", steps),
+                       ("rewards", "<f8", steps)])
+    return np.memmap(fname, dtype=record, mode="r", offset=EPISODES_HEADER.itemsize,
+                     shape=int(header["count"]))
+
+
+def load_source(source):
+    """source は (言語のディレクトリ, None) なら test エピソード，
+    (言語のディレクトリ, i) なら episodes.bin の i 番目のエピソード
+    """
+    lang_dir, idx = source
+    if idx is None:
+        return load_csv(lang_dir)
+    record = load_episodes(path.join(lang_dir, EPISODES_FNAME))[idx]
+    return np.array(record["states"]), np.array(record["actions"]), np.array(record["rewards"])
+
+
+def count_frames(source):
+    lang_dir, idx = source
+    if idx is None:
+        with open(path.join(lang_dir, STATES_FNAME)) as f:
+            return sum(1 for line in f if line.strip())
+    return load_episodes(path.join(lang_dir, EPISODES_FNAME))[idx]["actions"].shape[0]
+
+
+def render_chunk(source, start, stop, gif):
+    """worker で [start, stop) のフレームを描く
+
+    プロセス間で送る量を減らすため，1 フレームずつ zlib で圧縮して返す．
+    gif なら 64 色に減色した P モード (+ パレット)，そうでなければ RGB のまま．
+    """
+    visualizer = Visualizer(*load_source(source))
+    frames = []
+    for step in range(start, stop):
+        img = visualizer.render(step)
+        if gif:
+            img = img.quantize(colors=64, method=Image.Quantize.FASTOCTREE)
+            frames.append((img.size, zlib.compress(img.tobytes(), 1), img.getpalette()))
+        else:
+            frames.append((img.size, zlib.compress(img.tobytes(), 1), None))
+    plt.close(visualizer.fig)
+    return frames
+
+
+def decode_frame(frame):
+    size, data, palette = frame
+    if palette is None:
+        return Image.frombytes("RGB", size, zlib.decompress(data))
+    img = Image.frombytes("P", size, zlib.decompress(data))
+    img.putpalette(palette)
+    return img
+
+
+def save_gif(frames, fname, tick):
+    images = [decode_frame(frame) for frame in frames]
+    images[0].save(fname, save_all=True, append_images=images[1:],
+                   duration=int(tick * 1000), loop=0)
+
+
+def save_video(frames, fname, fps):
+    """ffmpeg に RGB を流し込んで動画にする"""
+    (width, height), _, _ = frames[0]
+    cmd = ["ffmpeg", "-y", "-loglevel", "error",
+           "-f", "rawvideo", "-pix_fmt", "rgb24", "-s", f"{width}x{height}", "-r", str(fps),
+           "-i", "-", "-pix_fmt", "yuv420p", fname]
+    with subprocess.Popen(cmd, stdin=subprocess.PIPE) as proc:
+        for _, data, _ in frames:
+            proc.stdin.write(zlib.decompress(data))
+        proc.stdin.close()
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed: {proc.returncode}")
+
+
+def make_sources(lang_dirs, output, episodes):
+    """(source, 出力ファイル名) のリスト
+
+    episodes なら episodes.bin の各エピソードを output にエピソード番号をつけた名前で書く
+    """
+    sources = []
+    for lang_dir in lang_dirs:
+        if not episodes:
+            sources.append(((lang_dir, None), path.join(lang_dir, output)))
+            continue
+        stem, ext = path.splitext(output)
+        records = load_episodes(path.join(lang_dir, EPISODES_FNAME))
+        for idx, episode in enumerate(records["episode"]):
+            sources.append(((lang_dir, idx), path.join(lang_dir, f"{stem}_{episode}{ext}")))
+    return sources
+
+
+def render_dirs(lang_dirs, output, workers, episodes=False):
+    """全言語のフレームを 1 つのプロセスプールでまとめて描いて書き出す"""
+    gif = output.endswith(".gif")
+    if not gif and shutil.which("ffmpeg") is None:
+        raise RuntimeError("ffmpeg is required for non-GIF output")
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        jobs = {}
+        for source, fname in make_sources(lang_dirs, output, episodes):
+            frames_num = count_frames(source)
+            chunk = max(1, math.ceil(frames_num / workers))
+            jobs[fname] = [executor.submit(render_chunk, source, start,
+                                           min(start + chunk, frames_num), gif)
+                           for start in range(0, frames_num, chunk)]
+
+        for fname, futures in jobs.items():
+            frames = [frame for future in futures for frame in future.result()]
+            if gif:
+                save_gif(frames, fname, 1 / FRAMES_PER_SEC)
+            else:
+                save_video(frames, fname, FRAMES_PER_SEC)
+            print(f"saved: {fname}", file=sys.stderr)
 
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        print("Usage: python3 animation.py LANG_DIR", file=sys.stderr)
-        sys.exit(1)
-
-    lang_dir = sys.argv[1]
-
-    if not path.isdir(lang_dir):
-        print(f"No such directory: {lang_dir}", file=sys.stderr)
-        sys.exit(1)
-
-    visualizer = Visualizer(
-        path.join(lang_dir, STATES_FNAME),
-        path.join(lang_dir, ACTIONS_FNAME),
-        path.join(lang_dir, REWARDS_FNAME)
-    )
-    visualizer.make_animation()
-    visualizer.save(path.join(lang_dir, GIF_FNAME))
+    parser = argparse.ArgumentParser(usage="python3 animation.py LANG_DIR [LANG_DIR ...]")
+    parser.add_argument("lang_dirs", help="language directories", nargs="+")
+    parser.add_argument("-j", help="max processes", type=int, default=os.cpu_count())
+    parser.add_argument("-o", "--output", help="output file name (.gif or a video extension)",
+                        default=GIF_FNAME)
+    parser.add_argument("--episodes", help=f"render the training episodes in {EPISODES_FNAME}",
+                        action="store_true")
+    args = parser.parse_args()
+
+    for lang_dir in args.lang_dirs:
+        if not path.isdir(lang_dir):
+            print(f"No such directory: {lang_dir}", file=sys.stderr)
+            sys.exit(1)
+
+    render_dirs(args.lang_dirs, args.output, args.j, args.episodes)
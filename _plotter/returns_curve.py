@@ -1,3 +1,4 @@
+import itertools
 import matplotlib.pyplot as plt
 import numpy as np
 import os.path as path
@@ -6,9 +7,13 @@ import sys
 
 USAGE = """Usage: python3 returns_curve.py LANG_DIR"""
 DATA_FNAME = "returns.csv"
+BINARY_DATA_FNAME = "returns.bin"  # float64 (little endian) の生バイナリ
 DESCRIPTION_FNAME = "description.txt"
 IMAGE_FNAME = "returns.png"
 
+CHUNK_SIZE = 1 << 20  # 一度にメモリに載せるデータ数
+BUCKETS_NUM = 2000  # 横軸の分割数 (図の横幅のピクセル数より多ければよい)
+
 
 def get_lang_dir():
     if len(sys.argv) != 2:
@@ -23,26 +28,115 @@ def read_desc(fname):
     return buf.replace("\n", " ")
 
 
-def read_data(fname):
+def data_fname(dir):
+    """バイナリがあればそちらを優先する"""
+    fname = path.join(dir, BINARY_DATA_FNAME)
+    if path.isfile(fname):
+        return fname
+    return path.join(dir, DATA_FNAME)
+
+
+def is_binary(fname):
+    return fname.endswith(BINARY_DATA_FNAME)
+
+
+def count_data(fname):
+    """データの個数"""
+    if is_binary(fname):
+        return path.getsize(fname) // 8
+
+    n = 0
     with open(fname) as f:
-        return list(map(float, f.read().split()))
+        for line in f:
+            if line.strip():
+                n += 1
+    return n
+
 
+def iter_data(fname, chunk_size=CHUNK_SIZE):
+    """データを chunk_size 個ずつの float64 の配列として順に返す"""
+    if is_binary(fname):
+        data = np.memmap(fname, dtype="<f8", mode="r")
+        for start in range(0, len(data), chunk_size):
+            yield np.asarray(data[start:start + chunk_size])
+        return
 
-def plot(data, desc):
-    draw(data)
-    draw(convolve(data, len(data)//1000))
+    with open(fname) as f:
+        lines = (line for line in f if line.strip())
+        while True:
+            chunk = np.array(list(map(float, itertools.islice(lines, chunk_size))))
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+
+def summarize(fname, buckets_num=BUCKETS_NUM):
+    """データを 1 回なめて，区間ごとの最小値・最大値と区間の中央での移動平均を求める
+
+    移動平均の幅はデータ数の 1/1000 で，累積和の差から O(n) で計算する．
+    メモリは chunk と区間の数の分しか使わない．
+    """
+    n = count_data(fname)
+    buckets_num = min(buckets_num, n)
+    window = max(1, n // 1000)
+
+    # 区間 i は [edges[i], edges[i+1])
+    edges = np.linspace(0, n, buckets_num + 1).astype(np.int64)
+    ymin = np.full(buckets_num, np.inf)
+    ymax = np.full(buckets_num, -np.inf)
+
+    # 移動平均は区間の中央 c で data[c - window//2 : c - window//2 + window] の平均
+    centers = (edges[:-1] + edges[1:]) // 2
+    lo = centers - window // 2
+    hi = lo + window
+    valid = (lo >= 0) & (hi <= n)
+    centers, lo, hi = centers[valid], lo[valid], hi[valid]
+
+    # 累積和 cumsum[k] = sum(data[:k]) を必要な k でだけ覚えておく
+    need = np.unique(np.concatenate([lo, hi]))
+    cumsum_at = np.zeros(len(need))
+    total = 0.0
+
+    start = 0
+    for chunk in iter_data(fname):
+        stop = start + len(chunk)
+
+        # 最小値・最大値: chunk を区間の境目で切って区間ごとに集める
+        cuts = np.unique(np.concatenate([[start], edges[(edges > start) & (edges < stop)]]))
+        bucket_idx = np.searchsorted(edges, cuts, side="right") - 1
+        np.minimum.at(ymin, bucket_idx, np.minimum.reduceat(chunk, cuts - start))
+        np.maximum.at(ymax, bucket_idx, np.maximum.reduceat(chunk, cuts - start))
+
+        # 累積和
+        local = total + np.cumsum(chunk)
+        mask = (need > start) & (need <= stop)
+        cumsum_at[mask] = local[need[mask] - start - 1]
+        total = local[-1]
+
+        start = stop
+
+    moving_average = (cumsum_at[np.searchsorted(need, hi)] -
+                      cumsum_at[np.searchsorted(need, lo)]) / window
+
+    return edges, ymin, ymax, centers, moving_average
+
+
+def plot(summary, desc):
+    edges, ymin, ymax, centers, moving_average = summary
+    draw_envelope(edges, ymin, ymax)
+    plt.plot(centers + 1, moving_average)
     plt.xlabel("Episodes")
     plt.ylabel("Returns")
     plt.title(f"Episode-Return graph with {desc}")
 
 
-def draw(data):
-    x = np.arange(1, len(data)+1)
-    plt.plot(x, data)
-
-
-def convolve(data, num):
-    return np.convolve(data, np.ones(num)/num, mode="same")[num+1:-num]
+def draw_envelope(edges, ymin, ymax):
+    """区間ごとに最小値と最大値を往復する折れ線で元データの見た目を再現する"""
+    x = np.repeat((edges[:-1] + edges[1:]) / 2 + 1, 2)
+    y = np.empty(len(x))
+    y[0::2] = ymin
+    y[1::2] = ymax
+    plt.plot(x, y)
 
 
 def save(fname):
@@ -66,12 +160,12 @@ if __name__ == "__main__":
         sys.exit(1)
 
     try:
-        data = read_data(path.join(dir, DATA_FNAME))
+        summary = summarize(data_fname(dir))
     except Exception as e:
         print(f"data read error: {e}", file=sys.stderr)
         sys.exit(1)
 
-    plot(data, desc)
+    plot(summary, desc)
     try:
         save(path.join(dir, IMAGE_FNAME))
     except Exception as e:
@@ -1,9 +1,15 @@
+from array import array
+from bisect import bisect_right
 from math import pi
-import random
+import sys
+
+import rng
 
 
 class Agent:
-    def __init__(self):
+    backend = "dense"  # make_agent の backend 名
+
+    def __init__(self, **params):
         self.alpha = 0.1  # 学習率
         self.gamma = 0.999  # 割引率
         self.epsilon = 0.1  # ランダムに行動選択する割合
@@ -23,6 +29,19 @@ class Agent:
         self.xdot_num = 10
         self.thetadot_num = 50
 
+        # eps-greedy の乱数 (rng.make_rng の kind と seed)
+        self.rng_kind = "stdlib"
+        self.seed = None
+
+        # 既存の Q-table を使うときに渡す (None なら make_qtable でつくる)
+        self.qtable = None
+
+        # 上のパラメータを上書きする
+        for k, v in params.items():
+            if not hasattr(self, k):
+                raise AttributeError(f"unknown agent parameter: {k}")
+            setattr(self, k, v)
+
         # 状態分割の bins を生成
         self.x_bins = self.make_bins(self.x_limits, self.x_num)
         self.theta_bins = self.make_bins(self.theta_limits, self.theta_num)
@@ -30,46 +49,78 @@ class Agent:
         self.thetadot_bins = self.make_bins(
             self.thetadot_limits, self.thetadot_num)
 
-        self.qtable = self.make_qtable()
+        if self.qtable is None:
+            self.qtable = self.make_qtable()
+
+        self.rng = rng.make_rng(self.rng_kind, self.seed)
+
+        # ランダムに選んだ行動の回数 (telemetry 用)
+        self.explore_count = 0
 
     def action(self, s):
         """eps-greedy"""
-        if random.random() < self.epsilon:
-            return random.choice(self.actions)
+        return self.actions[self.action_idx(self.get_s_idx(s))]
+
+    def action_idx(self, s_idx):
+        """状態 s_idx で eps-greedy に選んだ行動の index"""
+        if self.rng.random() < self.epsilon:
+            self.explore_count += 1
+            # stdlib なら random.choice(self.actions) と同じ乱数の使い方
+            return self.rng.randrange(len(self.actions))
 
-        s_idx = self.get_s_idx(s)
-        max_idx = self.argmax(self.qtable[s_idx])
-        return self.actions[max_idx]
+        return self.argmax(self.qvalues(s_idx))
 
     def learn(self, s, a, r, snext):
-        s_idx = self.get_s_idx(s)
-        a_idx = self.actions.index(a)
-        snext_idx = self.get_s_idx(snext)
+        self.learn_idx(self.get_s_idx(s), self.actions.index(a), r, self.get_s_idx(snext))
+
+    def learn_idx(self, s_idx, a_idx, r, snext_idx):
+        sa_idx = s_idx * len(self.actions) + a_idx
+        self.qtable[sa_idx] = \
+            (1.0 - self.alpha) * self.qtable[sa_idx] + \
+            self.alpha * (r + self.gamma * max(self.qvalues(snext_idx)))
 
-        self.qtable[s_idx][a_idx] = \
-            (1.0 - self.alpha) * self.qtable[s_idx][a_idx] + \
-            self.alpha * (r + self.gamma * max(self.qtable[snext_idx]))
+    def start_episode(self):
+        """エピソードの最初に呼ばれる"""
+        pass
 
     def set_test_params(self):
         """test 用のパラメータに変更する"""
         self.alpha = 0.0
         self.epsilon = 0.0
 
+    def qvalues(self, s_idx):
+        """状態 s_idx の各行動の q-value"""
+        actions_num = len(self.actions)
+        return self.qtable[s_idx * actions_num:(s_idx + 1) * actions_num]
+
+    def states_num(self):
+        return self.x_num * self.theta_num * self.xdot_num * self.thetadot_num
+
+    def visited_states_num(self):
+        """一度でも learn した (q-value が初期値から変わった) 状態の数"""
+        actions_num = len(self.actions)
+        init_row = array("d", [self.init_qvalue]) * actions_num
+        qtable = self.qtable
+        return sum(1 for i in range(0, len(qtable), actions_num)
+                   if qtable[i:i + actions_num] != init_row)
+
+    def memory_bytes(self):
+        """Q-table が使っているメモリ量"""
+        return len(self.qtable) * self.qtable.itemsize
+
     def make_qtable(self):
         # NOTE: すごい多重配列にすると table 作るだけで心折れるので見送り
+        # (states, actions) の表を 1 本の float64 配列に平たく詰める
 
-        total_states_num = self.x_num * self.theta_num * self.xdot_num * self.thetadot_num
-        return [[self.init_qvalue] * len(self.actions) for _ in range(total_states_num)]
+        return array("d", [self.init_qvalue]) * (self.states_num() * len(self.actions))
 
     def make_bins(self, limits, num):
         width = (limits[1] - limits[0]) / (num - 2)
         return [limits[0] + width * i for i in range(num - 1)]
 
     def digitize(self, bins, x):
-        for i, v in enumerate(bins):
-            if x < v:
-                return i
-        return len(bins)
+        # x < v となる最初の bins の index (なければ len(bins))
+        return bisect_right(bins, x)
 
     def digitize_all(self, s):
         x_idx = self.digitize(self.x_bins, s[0])
@@ -89,3 +140,105 @@ class Agent:
             if v > max_val:
                 idx = i
         return idx
+
+
+class LazyAgent(Agent):
+    """learn した状態の行だけをつくる Q-table を持つ Agent
+
+    qtable は s_idx -> 各行動の q-value のリスト の dict で，
+    ない状態の q-value は init_qvalue とみなす．
+    状態の分割を細かくしても訪れた状態の分しかメモリを使わない．
+    """
+
+    backend = "lazy"
+
+    def learn_idx(self, s_idx, a_idx, r, snext_idx):
+        row = self.qtable.get(s_idx)
+        if row is None:
+            row = self.qtable[s_idx] = [self.init_qvalue] * len(self.actions)
+        row[a_idx] = \
+            (1.0 - self.alpha) * row[a_idx] + \
+            self.alpha * (r + self.gamma * max(self.qvalues(snext_idx)))
+
+    def qvalues(self, s_idx):
+        return self.qtable.get(s_idx, self.init_row)
+
+    def visited_states_num(self):
+        return len(self.qtable)
+
+    def memory_bytes(self):
+        return sys.getsizeof(self.qtable) + sum(
+            sys.getsizeof(s_idx) + sys.getsizeof(row) + sum(map(sys.getsizeof, row))
+            for s_idx, row in self.qtable.items())
+
+    def make_qtable(self):
+        self.init_row = (self.init_qvalue,) * len(self.actions)
+        return {}
+
+
+class TraceAgent(Agent):
+    """適格度トレースを使う Watkins の Q(lambda)
+
+    トレースは sa_idx -> 適格度 の dict で，挿入順 = 古い順になるようにしておく．
+    適格度は毎ステップ gamma * trace_decay 倍になるので，古いものから trace_min を
+    下回ったものを捨てれば，1 ステップで触るのは最近訪れた数十個の (s, a) だけで済む．
+    """
+
+    backend = "qlambda"
+
+    def __init__(self, **params):
+        self.trace_decay = 0.9  # lambda
+        self.trace_min = 0.01  # これより小さい適格度は捨てる
+        self.trace_max_len = 1000  # トレースの最大数
+        self.traces = {}
+        super().__init__(**params)
+
+    def start_episode(self):
+        self.traces.clear()
+
+    def learn_idx(self, s_idx, a_idx, r, snext_idx):
+        qtable = self.qtable
+        traces = self.traces
+        sa_idx = s_idx * len(self.actions) + a_idx
+
+        # 探索行動をとったらそれまでのトレースは切る
+        if qtable[sa_idx] < max(self.qvalues(s_idx)):
+            traces.clear()
+
+        delta = r + self.gamma * max(self.qvalues(snext_idx)) - qtable[sa_idx]
+
+        # replacing trace: 入れ直して一番新しい位置にする
+        traces.pop(sa_idx, None)
+        traces[sa_idx] = 1.0
+
+        alpha_delta = self.alpha * delta
+        decay = self.gamma * self.trace_decay
+        for k, e in traces.items():
+            qtable[k] += alpha_delta * e
+            traces[k] = e * decay
+
+        # 古い (= 小さい) ものから捨てる
+        while traces:
+            k = next(iter(traces))
+            if traces[k] >= self.trace_min and len(traces) <= self.trace_max_len:
+                break
+            del traces[k]
+
+
+# Agent の種類 -> Agent のクラス
+BACKENDS = {
+    "dense": Agent,
+    "lazy": LazyAgent,
+    "qlambda": TraceAgent,
+}
+
+
+def make_agent(backend="dense", **params):
+    if backend == "dyna":
+        # NumPy が要るので使うときだけ読み込む
+        import planning
+        return planning.DynaAgent(**params)
+    if backend == "tile":
+        import tile_coding
+        return tile_coding.TileCodingAgent(**params)
+    return BACKENDS[backend](**params)
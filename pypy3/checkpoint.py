@@ -0,0 +1,131 @@
+"""学習の途中経過 (Q-table, 乱数の状態と seed, エピソード数) の保存と復元
+
+ファイルの中身 (すべて little endian)
+
+    magic        4 bytes  b"ARLC"
+    version      uint32
+    episode      uint64   終わったエピソード数 (= returns.bin に書いた収益の数)
+    seed flag    uint8    Agent の seed が None でなければ 1
+    seed         int64    Agent の seed (再開しても spec.json に最初の seed が残るように)
+    rng version  int32    random.getstate() の 1 要素目
+    rng state    uint32 * 625
+    gauss flag   uint8    random.getstate() の 3 要素目が None でなければ 1
+    gauss next   float64
+    qtable len   uint64
+    qtable       float64 * qtable len
+
+乱数はグローバルの random の状態だけを保存する．
+そのため Q-table が array で，それ以外に学習中の状態を持たない Agent (BACKENDS) のうち，
+eps-greedy の乱数がグローバルの random (rng_kind = "stdlib") のものだけを扱う．
+"""
+
+import random
+import struct
+import sys
+import time
+from array import array
+
+import atomic_write
+
+
+MAGIC = b"ARLC"
+VERSION = 2
+RNG_STATE_LEN = 625
+
+HEADER = struct.Struct(f"<4sIQBqi{RNG_STATE_LEN}IBdQ")
+
+# checkpoint できる Agent の backend
+BACKENDS = ("dense", "qlambda")
+
+
+def unsupported_reason(ag):
+    """ag を checkpoint で保存・復元できない理由 (できるなら None)"""
+    if ag.backend not in BACKENDS or not isinstance(ag.qtable, array):
+        return f"the {ag.backend} backend"
+    # block をまとめて引く乱数の状態は保存しないので，再開すると乱数列が続きにならない
+    if ag.rng is not random:
+        return f"rng_kind {ag.rng_kind}"
+    return None
+
+
+def supports(ag):
+    """ag を checkpoint で保存・復元できるか"""
+    return unsupported_reason(ag) is None
+
+
+def check_supported(ag):
+    reason = unsupported_reason(ag)
+    if reason is not None:
+        raise TypeError(f"checkpoint does not support {reason}")
+
+
+def save(fname, exp, episode):
+    """exp の状態を fname に書く
+
+    一時ファイルに書いてから rename するので，途中で落ちても前の checkpoint は壊れない
+    """
+    check_supported(exp.agent)
+
+    rng_version, rng_state, gauss_next = random.getstate()
+    seed = exp.agent.seed
+    header = HEADER.pack(MAGIC, VERSION, episode, seed is not None, seed or 0,
+                         rng_version, *rng_state,
+                         gauss_next is not None, gauss_next or 0.0, len(exp.agent.qtable))
+
+    qtable = exp.agent.qtable
+    if sys.byteorder == "big":
+        qtable = array("d", qtable)
+        qtable.byteswap()
+
+    with atomic_write.replacing(fname) as f:
+        f.write(header)
+        f.write(qtable)
+
+
+def load(fname, exp):
+    """fname の状態を exp と random に戻し，終わったエピソード数を返す
+
+    exp.agent.seed も保存したときの seed に戻す (乱数の状態はもう戻っているので使わない)
+    """
+    check_supported(exp.agent)
+
+    with open(fname, "rb") as f:
+        header = HEADER.unpack(f.read(HEADER.size))
+        magic, version, episode, has_seed, seed, rng_version = header[:6]
+        rng_state = header[6:6 + RNG_STATE_LEN]
+        has_gauss, gauss_next, qtable_len = header[6 + RNG_STATE_LEN:]
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"not a checkpoint file (version {VERSION}): {fname}")
+        if qtable_len != len(exp.agent.qtable):
+            raise ValueError(f"qtable size mismatch: {qtable_len} != {len(exp.agent.qtable)}")
+
+        qtable = array("d")
+        qtable.frombytes(f.read(qtable_len * qtable.itemsize))
+        if sys.byteorder == "big":
+            qtable.byteswap()
+
+    exp.agent.qtable = qtable
+    exp.agent.seed = seed if has_seed else None
+    random.setstate((rng_version, rng_state, gauss_next if has_gauss else None))
+    return episode
+
+
+class Checkpointer:
+    """Experiment.run から毎エピソード呼ばれ，interval 秒ごとに checkpoint を書く"""
+
+    def __init__(self, fname, returns_log, interval=300.0):
+        self.fname = fname
+        self.returns_log = returns_log
+        self.interval = interval
+        self.next_time = time.monotonic() + interval
+
+    def __call__(self, exp, episode, ret):
+        """episode 個のエピソードが終わったところで呼ぶ"""
+        if time.monotonic() < self.next_time:
+            return
+
+        # checkpoint の位置まで収益を書き出しておく
+        self.returns_log.flush()
+        save(self.fname, exp, episode)
+        self.next_time = time.monotonic() + self.interval
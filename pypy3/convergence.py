@@ -0,0 +1,86 @@
+"""収益が伸びなくなったところで学習を止める Experiment.run の hook"""
+
+import math
+
+
+class ConvergenceMonitor:
+    """収益の指数移動平均 (metric = "rolling") か greedy 方策の収益 (metric = "test") を
+    check_every エピソードごとに見て，patience 回続けて tolerance より伸びなければ止める
+
+    メモリは統計量の数個分だけで，何エピソード回しても増えない．
+    """
+
+    def __init__(self, **params):
+        self.metric = "rolling"  # "rolling" か "test"
+        self.window = 1000  # 指数移動平均の実効的な幅 [episodes]
+        self.check_every = 1000  # 伸びたかを調べる間隔 [episodes]
+        self.tolerance = 1.0  # これより大きく伸びたら伸びたとみなす
+        self.patience = 10  # 何回続けて伸びなければ止めるか
+        self.min_episodes = 10000  # これより前には止めない
+
+        # 上のパラメータを上書きする
+        for k, v in params.items():
+            if not hasattr(self, k):
+                raise AttributeError(f"unknown convergence parameter: {k}")
+            setattr(self, k, v)
+
+        if self.metric not in ("rolling", "test"):
+            raise ValueError(f"unknown convergence metric: {self.metric}")
+
+        # 収益の指数移動平均と分散
+        self.decay = 2.0 / (self.window + 1)
+        self.mean = None
+        self.var = 0.0
+
+        self.best = -math.inf
+        self.best_episode = None
+        self.stale = 0
+        self.stop_episode = None
+
+    def __call__(self, exp, episode, ret):
+        """止めるときは True を返す"""
+        self.update(ret)
+        if episode % self.check_every != 0:
+            return False
+
+        value = self.mean if self.metric == "rolling" else greedy_return(exp)
+        if value > self.best + self.tolerance:
+            self.best = value
+            self.best_episode = episode
+            self.stale = 0
+        else:
+            self.stale += 1
+
+        if episode >= self.min_episodes and self.stale >= self.patience:
+            self.stop_episode = episode
+            return True
+        return False
+
+    def update(self, ret):
+        if self.mean is None:
+            self.mean = ret
+            return
+        diff = ret - self.mean
+        self.mean += self.decay * diff
+        self.var = (1.0 - self.decay) * (self.var + self.decay * diff * diff)
+
+    def std(self):
+        return math.sqrt(self.var)
+
+    def summary(self):
+        return {
+            "metric": self.metric,
+            "stop_episode": self.stop_episode,
+            "best": self.best,
+            "best_episode": self.best_episode,
+            "rolling_mean": self.mean,
+            "rolling_std": self.std(),
+        }
+
+
+def greedy_return(exp):
+    """学習も乱数も使わずに greedy 方策で 1 エピソード動かした収益
+
+    数え方は Experiment.train_episode と同じ．
+    """
+    return exp.play_episode(learn=False)
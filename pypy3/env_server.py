@@ -0,0 +1,254 @@
+"""CartPole を Unix socket 越しに動かすサーバとクライアント
+
+Usage: python3 env_server.py serve [--socket PATH] [--max-delay SEC]
+       python3 env_server.py bench [--socket PATH] [--clients N ...] [--batch N ...]
+                                   [--requests N]
+
+サーバは状態を持たず，リクエストで送られてきた状態と行動から次の状態と報酬を返す．
+同時に来た複数のクライアントのリクエストは 1 つにまとめて VectorCartPole で 1 回だけ進める．
+
+プロトコル (すべて little endian)
+
+    リクエスト  op uint8, n uint32, 続けて op ごとの中身
+        RESET   なし                                 初期状態を n 個もらう
+        STEP    状態 float64 * 4 * n, 行動 float64 * n  n 個の状態を 1 ステップ進める
+    レスポンス  op uint8, n uint32, 続けて op ごとの中身
+        RESET   状態 float64 * 4 * n
+        STEP    次の状態 float64 * 4 * n, 報酬 float64 * n
+        ERROR   メッセージ (utf-8, n bytes)
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+import vector_cartpole
+
+
+SOCKET_FNAME = "/tmp/anylang-rl-cartpole.sock"
+
+OP_RESET = 0
+OP_STEP = 1
+OP_ERROR = 255
+
+HEADER = struct.Struct("<BI")
+F8 = np.dtype("<f8")
+MAX_BATCH = 1 << 20  # 1 リクエストあたりの状態の数の上限
+
+
+class EnvServer:
+    """同時に来た STEP リクエストをまとめて VectorCartPole で進める"""
+
+    def __init__(self, max_delay=0.0, **params):
+        self.max_delay = max_delay  # 最初のリクエストから他のリクエストを待つ時間 [s]
+        self.env = vector_cartpole.VectorCartPole(0, **params)
+        self.queue = None
+
+        # まとめた回数と状態の数 (ベンチ用)
+        self.batches = 0
+        self.steps = 0
+
+    async def serve(self, path):
+        self.queue = asyncio.Queue()
+        if os.path.exists(path):
+            os.remove(path)
+        server = await asyncio.start_unix_server(self.handle, path=path)
+        batcher = asyncio.create_task(self.run_batcher())
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+    async def handle(self, reader, writer):
+        """1 クライアントのリクエストを順に処理する"""
+        try:
+            while True:
+                try:
+                    op, n = HEADER.unpack(await reader.readexactly(HEADER.size))
+                except asyncio.IncompleteReadError:
+                    break
+
+                if n > MAX_BATCH:
+                    self.write_error(writer, f"batch too large: {n}")
+                    break
+
+                if op == OP_RESET:
+                    s = np.tile(np.array(self.env.init_state, dtype=F8), (n, 1))
+                    writer.write(HEADER.pack(OP_RESET, n) + s.tobytes())
+                elif op == OP_STEP:
+                    payload = await reader.readexactly(n * 5 * F8.itemsize)
+                    s = np.frombuffer(payload, dtype=F8, count=n * 4).reshape(n, 4)
+                    a = np.frombuffer(payload, dtype=F8, offset=n * 4 * F8.itemsize)
+
+                    done = asyncio.get_running_loop().create_future()
+                    self.queue.put_nowait((s, a, done))
+                    snext, r = await done
+                    writer.write(HEADER.pack(OP_STEP, n) + snext.tobytes() + r.tobytes())
+                else:
+                    self.write_error(writer, f"unknown op: {op}")
+                    break
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def write_error(self, writer, message):
+        data = message.encode()
+        writer.write(HEADER.pack(OP_ERROR, len(data)) + data)
+
+    async def run_batcher(self):
+        """キューにたまっている STEP をまとめて 1 回の step にする"""
+        while True:
+            requests = [await self.queue.get()]
+            if self.max_delay > 0:
+                await asyncio.sleep(self.max_delay)
+            while not self.queue.empty():
+                requests.append(self.queue.get_nowait())
+
+            env = self.env
+            env.s = np.concatenate([s for s, _, _ in requests])
+            env.step(np.concatenate([a for _, a, _ in requests]))
+            snext = env.state()
+            r = env.reward()
+            self.batches += 1
+            self.steps += len(snext)
+
+            start = 0
+            for s, _, done in requests:
+                stop = start + len(s)
+                if not done.cancelled():
+                    done.set_result((snext[start:stop], r[start:stop]))
+                start = stop
+
+
+class EnvClient:
+    """EnvServer に asyncio でつなぐクライアント (1 接続で 1 リクエストずつ)"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    @classmethod
+    async def connect(cls, path=SOCKET_FNAME):
+        return cls(*await asyncio.open_unix_connection(path))
+
+    async def request(self, op, n, payload=b""):
+        self.writer.write(HEADER.pack(op, n) + payload)
+        await self.writer.drain()
+
+        res_op, res_n = HEADER.unpack(await self.reader.readexactly(HEADER.size))
+        if res_op == OP_ERROR:
+            raise RuntimeError((await self.reader.readexactly(res_n)).decode())
+        return res_n
+
+    async def reset(self, n):
+        """初期状態 shape = (n, 4)"""
+        n = await self.request(OP_RESET, n)
+        data = await self.reader.readexactly(n * 4 * F8.itemsize)
+        return np.frombuffer(data, dtype=F8).reshape(n, 4)
+
+    async def step(self, s, a):
+        """状態 s (shape = (n, 4)) で行動 a (shape = (n,)) をとった次の状態と報酬"""
+        s = np.ascontiguousarray(s, dtype=F8)
+        a = np.ascontiguousarray(a, dtype=F8)
+        n = await self.request(OP_STEP, len(a), s.tobytes() + a.tobytes())
+        data = await self.reader.readexactly(n * 5 * F8.itemsize)
+        snext = np.frombuffer(data, dtype=F8, count=n * 4).reshape(n, 4)
+        r = np.frombuffer(data, dtype=F8, offset=n * 4 * F8.itemsize)
+        return snext, r
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def serve(path, max_delay):
+    asyncio.run(EnvServer(max_delay).serve(path))
+
+
+async def wait_for_socket(path, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            client = await EnvClient.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            await asyncio.sleep(0.05)
+            continue
+        await client.close()
+        return
+    raise TimeoutError(f"server did not start: {path}")
+
+
+async def bench_clients(path, clients_num, batch_size, requests_num, seed):
+    """clients_num 個のクライアントが batch_size 個ずつ requests_num 回 STEP を送る"""
+    rng = np.random.default_rng(seed)
+    clients = [await EnvClient.connect(path) for _ in range(clients_num)]
+    latencies = []
+
+    async def run(client):
+        s = await client.reset(batch_size)
+        for _ in range(requests_num):
+            a = rng.choice([-10.0, 10.0], size=batch_size)
+            start = time.perf_counter()
+            s, _ = await client.step(s, a)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run(client) for client in clients))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+
+    latencies = np.array(latencies)
+    return {
+        "clients": clients_num,
+        "batch": batch_size,
+        "requests": len(latencies),
+        "latency_p50_us": float(np.percentile(latencies, 50) * 1e6),
+        "latency_p99_us": float(np.percentile(latencies, 99) * 1e6),
+        "steps_per_sec": clients_num * batch_size * requests_num / elapsed,
+    }
+
+
+def bench(path, clients_list, batch_list, requests_num, max_delay):
+    """別プロセスでサーバを立てて，クライアント数と batch の大きさごとに測る"""
+    server = multiprocessing.Process(target=serve, args=(path, max_delay), daemon=True)
+    server.start()
+    try:
+        asyncio.run(wait_for_socket(path))
+        return [asyncio.run(bench_clients(path, clients_num, batch_size, requests_num, seed=0))
+                for clients_num in clients_list for batch_size in batch_list]
+    finally:
+        server.terminate()
+        server.join()
+        if os.path.exists(path):
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    # コマンドライン引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["serve", "bench"])
+    parser.add_argument("--socket", help="Unix socket path", default=SOCKET_FNAME)
+    parser.add_argument("--max-delay", help="seconds to wait for more requests to coalesce",
+                        type=float, default=0.0)
+    parser.add_argument("--clients", help="numbers of clients (bench)",
+                        type=int, nargs="+", default=[1, 8, 64])
+    parser.add_argument("--batch", help="states per request (bench)",
+                        type=int, nargs="+", default=[1, 64])
+    parser.add_argument("--requests", help="requests per client (bench)", type=int, default=1000)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.socket, args.max_delay)
+    else:
+        results = bench(args.socket, args.clients, args.batch, args.requests, args.max_delay)
+        json.dump({"max_delay": args.max_delay, "results": results}, sys.stdout, indent=2)
+        print()
@@ -0,0 +1,200 @@
+"""1 つの Q-table を複数のプロセスでロックなしに同時に学習する (Hogwild!)
+
+Usage: python3 hogwild.py [--workers W ...] [--threshold R] [--episodes N]
+                          [--agent-params JSON] [--seed S]
+
+Q-table は multiprocessing.shared_memory に置き，各 worker は
+shm.buf.cast("d") を Agent の qtable として自分の CartPole で train_episode を回す．
+更新はロックをとらないので，たまに他の worker の更新を上書きすることがある．
+収益は共有メモリのリングバッファで親プロセスに返し，
+親は収益の移動平均が threshold に届くまでの実時間を測る．
+"""
+
+from array import array
+import argparse
+import collections
+import json
+import multiprocessing
+from multiprocessing import shared_memory
+import random
+import struct
+import sys
+import time
+
+import agent
+import cartpole
+import experiment
+
+
+RING_CAPACITY = 1 << 16
+ROLLING_WINDOW = 100  # 収益の移動平均の幅 (bench.py の learner と同じ)
+POLL_INTERVAL = 0.05  # 親がリングバッファを見に行く間隔 [s]
+
+
+class SharedRing:
+    """複数のプロセスから append できる float64 のリングバッファ
+
+    先頭 8 bytes に今までに書かれた個数 (head) を置き，その後ろが capacity 個の値．
+    読むのは 1 プロセスだけで，読んだ位置 (tail) は読む側が持つ．
+    """
+
+    HEAD = struct.Struct("Q")
+
+    def __init__(self, capacity, lock, name=None):
+        self.capacity = capacity
+        self.lock = lock
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=name is None, size=self.HEAD.size + capacity * 8)
+        self.values = self.shm.buf[self.HEAD.size:].cast("d")
+        if name is None:
+            self.HEAD.pack_into(self.shm.buf, 0, 0)
+        self.tail = 0
+        self.dropped = 0
+
+    def append(self, value):
+        with self.lock:
+            head, = self.HEAD.unpack_from(self.shm.buf, 0)
+            self.values[head % self.capacity] = value
+            self.HEAD.pack_into(self.shm.buf, 0, head + 1)
+
+    def read_new(self):
+        """前回から増えた値のリスト (追い越されて消えた分は dropped に数える)"""
+        with self.lock:
+            head, = self.HEAD.unpack_from(self.shm.buf, 0)
+            if head - self.tail > self.capacity:
+                self.dropped += head - self.tail - self.capacity
+                self.tail = head - self.capacity
+            new = [self.values[i % self.capacity] for i in range(self.tail, head)]
+        self.tail = head
+        return new
+
+    def close(self):
+        self.values.release()
+        self.shm.close()
+
+
+def worker(qtable_name, ring_name, ring_capacity, lock, stop, agent_params, env_params, seed):
+    """stop が立つまで共有の Q-table で学習し続ける
+
+    agent_params に seed があっても worker ごとの seed で上書きし，探索の乱数列が重ならないようにする．
+    """
+    random.seed(seed)
+
+    shm = shared_memory.SharedMemory(name=qtable_name)
+    qtable = shm.buf.cast("d")
+    ring = SharedRing(ring_capacity, lock, name=ring_name)
+    exp = None
+    try:
+        exp = experiment.Experiment(dict(agent_params, qtable=qtable, seed=seed), env_params)
+        while not stop.is_set():
+            ring.append(exp.train_episode())
+    finally:
+        # Agent が持っている view を先に手放さないと shm を close できない
+        exp = None
+        qtable.release()
+        shm.close()
+        ring.close()
+
+
+def train(workers_num, agent_params=None, env_params=None, threshold=-600.0,
+          episodes_num=20000, seed=0):
+    """workers_num 個の worker で学習し，移動平均が threshold に届くまでの時間などを返す
+
+    届かなくても合計 episodes_num エピソードで打ち切る．
+    学習した Q-table (array) も返す．
+    """
+    agent_params = agent_params or {}
+    env_params = env_params or {}
+
+    # パラメータの間違いは共有メモリをつくる前に親で見つける
+    ag = agent.make_agent(**agent_params)
+    cartpole.CartPole(**env_params)
+    init = ag.qtable
+    if not (isinstance(init, array) and init.typecode == "d"):
+        raise ValueError(f"hogwild needs a flat array('d') Q-table; "
+                         f"the {ag.backend} backend is not supported")
+
+    # 初期値の入った Q-table を共有メモリに写す
+    qtable_shm = shared_memory.SharedMemory(create=True, size=len(init) * init.itemsize)
+    qtable_shm.buf[:] = init.tobytes()
+
+    lock = multiprocessing.Lock()
+    stop = multiprocessing.Event()
+    ring = SharedRing(RING_CAPACITY, lock)
+
+    procs = [multiprocessing.Process(
+        target=worker, args=(qtable_shm.name, ring.shm.name, RING_CAPACITY, lock, stop,
+                             agent_params, env_params, seed + i))
+        for i in range(workers_num)]
+
+    recent = collections.deque(maxlen=ROLLING_WINDOW)
+    episodes = 0
+    reached = False
+    start = time.perf_counter()
+    try:
+        try:
+            for proc in procs:
+                proc.start()
+
+            while not reached and episodes < episodes_num:
+                time.sleep(POLL_INTERVAL)
+                # stop の前に終わった worker は落ちている
+                for i, proc in enumerate(procs):
+                    if proc.exitcode is not None:
+                        raise RuntimeError(f"worker {i} exited with code {proc.exitcode}")
+                for ret in ring.read_new():
+                    recent.append(ret)
+                    episodes += 1
+                    if len(recent) == ROLLING_WINDOW and \
+                            sum(recent) / ROLLING_WINDOW >= threshold:
+                        reached = True
+                        break
+            sec = time.perf_counter() - start
+        finally:
+            stop.set()
+            for proc in procs:
+                proc.join()
+
+        qtable = array("d", qtable_shm.buf.tobytes())
+    finally:
+        # worker が落ちたときも共有メモリは消す
+        ring.close()
+        ring.shm.unlink()
+        qtable_shm.close()
+        qtable_shm.unlink()
+
+    result = {
+        "workers": workers_num,
+        "reached": reached,
+        "episodes": episodes,
+        "sec": sec,
+        "episodes_per_sec": episodes / sec,
+        "final_mean": sum(recent) / len(recent) if recent else None,
+        "dropped": ring.dropped,
+    }
+    return result, qtable
+
+
+if __name__ == "__main__":
+    # コマンドライン引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", help="numbers of worker processes to compare",
+                        type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--threshold", help="target rolling mean return",
+                        type=float, default=-600.0)
+    parser.add_argument("--episodes", help="max episodes (all workers)", type=int, default=20000)
+    parser.add_argument("--agent-params", help="Agent parameters (JSON)",
+                        type=json.loads, default={})
+    parser.add_argument("--seed", help="random seed of the first worker", type=int, default=0)
+    args = parser.parse_args()
+
+    results = []
+    for workers_num in args.workers:
+        result, _ = train(workers_num, args.agent_params, threshold=args.threshold,
+                          episodes_num=args.episodes, seed=args.seed)
+        results.append(result)
+        print(f"workers={workers_num}: {result}", file=sys.stderr)
+
+    json.dump({"cpu_count": multiprocessing.cpu_count(), "threshold": args.threshold,
+               "results": results}, sys.stdout, indent=2)
+    print()
@@ -1,25 +1,125 @@
+import argparse
+import json
+import os.path
+import random
+import sys
+
+import checkpoint
+import convergence
 import experiment
+import policy
+import recorder
+import returns_log
+import spec as run_spec
+import telemetry
 
-exp = experiment.Experiment()
-returns = exp.run()
-history = exp.test()
+# コマンドライン引数の処理
+parser = argparse.ArgumentParser()
+parser.add_argument("--spec", help="run spec file (JSON or TOML)", metavar="FILE")
+parser.add_argument("--profile-run", help="few episodes for quick performance checks",
+                    action="store_true")
+parser.add_argument("--policy", help="skip training and test a saved policy", metavar="FILE")
+parser.add_argument("--telemetry", help="write training telemetry (JSON lines) to FILE, - for stderr",
+                    metavar="FILE")
+parser.add_argument("--telemetry-every", help="episodes between telemetry records",
+                    type=int, default=1000)
+args = parser.parse_args()
 
-with open("returns.csv", "w") as f:
-    for r in returns:
-        f.write(str(r))
-        f.write("\n")
+spec = run_spec.load(args.spec, args.profile_run)
+output = spec["output"]
+
+# seed がなければ決めて spec.json に書き，同じ学習を再現できるようにする
+if spec["agent"].get("seed") is None:
+    spec["agent"]["seed"] = random.getrandbits(32)
+random.seed(spec["agent"]["seed"])
+
+exp = experiment.Experiment(spec["agent"], spec["env"], **spec["experiment"])
+
+
+def train():
+    # checkpoint できない backend や乱数では途中経過を保存しない
+    checkpointing = checkpoint.supports(exp.agent)
+    if not checkpointing:
+        print(f"warning: checkpoints do not support {checkpoint.unsupported_reason(exp.agent)}; "
+              "training will not be resumable", file=sys.stderr)
+
+    # 前回の checkpoint があればそこから再開する
+    start_episode = 0
+    if checkpointing and os.path.isfile(output["checkpoint"]):
+        start_episode = checkpoint.load(output["checkpoint"], exp)
+
+    # 途中で落ちても spec.json から再現できるように，学習の前にも seed などを書いておく
+    # (再開したときは checkpoint に入っていた最初の seed になる)
+    run_spec.save(run_spec.resolve(spec, exp), output["spec"])
+
+    telemetry_out = None
+    if args.telemetry == "-":
+        telemetry_out = sys.stderr
+    elif args.telemetry is not None:
+        telemetry_out = open(args.telemetry, "a")
+
+    with returns_log.ReturnsWriter(output["returns"], start=start_episode) as log:
+        hooks = []
+        if checkpointing:
+            hooks.append(checkpoint.Checkpointer(output["checkpoint"], log))
+        telemetry_hook = None
+        if telemetry_out is not None:
+            telemetry_hook = telemetry.Telemetry(telemetry_out, args.telemetry_every)
+            hooks.append(telemetry_hook)
+        monitor = None
+        if spec["convergence"]:
+            monitor = convergence.ConvergenceMonitor(**spec["convergence"])
+            hooks.append(monitor)
+        episode_recorder = None
+        if spec["recorder"]:
+            episode_recorder = recorder.EpisodeRecorder(output["episodes"], exp.steps_num,
+                                                        start=start_episode, **spec["recorder"])
+        exp.run(log, hooks, start_episode, episode_recorder)
+
+    # 収束して途中で止めたときも最後の区間を書き出す
+    if telemetry_hook is not None:
+        telemetry_hook.finish(exp, exp.episodes_num)
+    if telemetry_out is not None and telemetry_out is not sys.stderr:
+        telemetry_out.close()
+
+    if episode_recorder is not None:
+        episode_recorder.close()
+
+    if monitor is not None:
+        print(json.dumps({"convergence": monitor.summary()}))
+
+    # 最後まで終わったら checkpoint はいらない
+    if os.path.isfile(output["checkpoint"]):
+        os.remove(output["checkpoint"])
+
+    if policy.supports(exp.agent):
+        policy.save(exp.agent, output["policy"])
+    else:
+        print(f"warning: the {exp.agent.backend} backend cannot be saved as a policy file",
+              file=sys.stderr)
+
+
+if args.policy is None:
+    train()
+    run_spec.save(run_spec.resolve(spec, exp), output["spec"])
+    history = exp.test()
+else:
+    # 学習済みの方策を読み込み専用で mmap し，学習も乱数も使わない greedy 方策でテストだけする
+    # (spec.json は学習したときの記録なので書き換えない)
+    exp.agent = policy.load(args.policy)
+    history = exp.one_episode(learn=False)
 
-with open("states.csv", "w") as f:
+with open(output["states"], "w") as f:
     for s in history.states:
         f.write(",".join(map(str, s)))
         f.write("\n")
 
-with open("actions.csv", "w") as f:
+with open(output["actions"], "w") as f:
     for a in history.actions:
         f.write(str(a))
         f.write("\n")
 
-with open("rewards.csv", "w") as f:
+with open(output["rewards"], "w") as f:
     for r in history.rewards:
         f.write(str(r))
         f.write("\n")
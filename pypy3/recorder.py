@@ -0,0 +1,172 @@
+"""学習中のエピソードの軌跡を選んで残す
+
+ファイルの中身 (すべて little endian)
+
+    magic        4 bytes  b"ARLE"
+    version      uint32
+    steps        uint32   1 エピソードのステップ数
+    count        uint32   書き終えたエピソードの数
+    エピソードが count 個 (一定間隔のものがエピソード番号の順に並び，そのあとに上位・下位のもの)
+        episode  uint64   何エピソード目か (1 始まり)
+        flags    uint64   残した理由 (EVERY | BEST | WORST の組み合わせ)
+        return   float64
+        states   float64 * steps * 4   各行が [x, theta, xdot, thetadot]
+        actions  float64 * steps
+        rewards  float64 * steps
+
+1 エピソードの大きさは固定なので，NumPy の構造化 dtype でそのまま読める
+(_plotter/animation.py の load_episodes)．
+count はエピソードを 1 つ書き終えるたびに書き直すので，途中で落ちてもそこまでのファイルは読める．
+"""
+
+import heapq
+import os
+import struct
+import sys
+from array import array
+
+
+MAGIC = b"ARLE"
+VERSION = 1
+
+HEADER = struct.Struct("<4sIII")
+RECORD = struct.Struct("<QQd")
+
+EVERY = 1
+BEST = 2
+WORST = 4
+
+
+class EpisodeRecorder:
+    """every エピソードごとの 1 つ，収益の上位 best_n 個と下位 worst_n 個のエピソードを fname に残す
+
+    軌跡は毎エピソード同じバッファ (states, actions, rewards) に上書きする．
+    一定間隔のエピソードは残すと決まったときにバッファからそのままファイルへ追記するので，
+    メモリに持つのは上位・下位の best_n + worst_n 個だけで，途中で落ちてもそこまでの分は残る．
+    上位・下位のエピソードは学習が終わるまで決まらないので close で書く．
+
+    start > 0 なら既存のファイルのうちエピソード番号が start までのものを残してその続きから書く
+    (checkpoint からの再開用)．上位・下位は再開したあとのエピソードから選ぶ．
+    """
+
+    __slots__ = ("every", "best_n", "worst_n", "steps_num", "record_size",
+                 "states", "actions", "rewards", "best", "worst", "f", "count")
+
+    def __init__(self, fname, steps_num, start=0, **params):
+        self.every = 0  # 0 なら一定間隔では残さない
+        self.best_n = 0
+        self.worst_n = 0
+
+        # 上のパラメータを上書きする
+        for k, v in params.items():
+            if k not in ("every", "best_n", "worst_n"):
+                raise AttributeError(f"unknown recorder parameter: {k}")
+            setattr(self, k, v)
+
+        self.steps_num = steps_num
+        self.record_size = RECORD.size + 8 * steps_num * 6
+        self.states = array("d", [0.0]) * (steps_num * 4)
+        self.actions = array("d", [0.0]) * steps_num
+        self.rewards = array("d", [0.0]) * steps_num
+
+        self.best = []  # (収益, エピソード番号, 軌跡) の最小ヒープ
+        self.worst = []  # (-収益, -エピソード番号, 軌跡) の最小ヒープ
+
+        self.count = 0
+        if start > 0:
+            self.f = open(fname, "r+b")
+            magic, version, steps, count = HEADER.unpack(self.f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION or steps != steps_num:
+                self.f.close()
+                raise ValueError(f"{fname} is not an episodes file with {steps_num} steps")
+            # 一定間隔で書いたもののうち start までを残す
+            self.count = count
+            kept = 0
+            for episode, flags in self.index():
+                if not flags & EVERY or episode > start:
+                    break
+                kept += 1
+            self.count = kept
+            self.f.truncate(HEADER.size + self.count * self.record_size)
+        else:
+            self.f = open(fname, "w+b")
+        self.write_header()
+
+    def write(self, step, s, a, r):
+        """step 番目のステップの値をバッファに書く (Experiment.play_episode の observe)"""
+        i = step * 4
+        states = self.states
+        states[i], states[i + 1], states[i + 2], states[i + 3] = s
+        self.actions[step] = a
+        self.rewards[step] = r
+
+    def snapshot(self):
+        return array("d", self.states), array("d", self.actions), array("d", self.rewards)
+
+    def select(self, episode, ret):
+        """バッファに書かれたエピソードを残すか決める"""
+        if self.every > 0 and episode % self.every == 0:
+            self.append(episode, EVERY, ret, (self.states, self.actions, self.rewards))
+
+        if self.best_n > 0:
+            if len(self.best) < self.best_n:
+                heapq.heappush(self.best, (ret, episode, self.snapshot()))
+            elif ret > self.best[0][0]:
+                heapq.heapreplace(self.best, (ret, episode, self.snapshot()))
+
+        if self.worst_n > 0:
+            if len(self.worst) < self.worst_n:
+                heapq.heappush(self.worst, (-ret, -episode, self.snapshot()))
+            elif -ret > self.worst[0][0]:
+                heapq.heapreplace(self.worst, (-ret, -episode, self.snapshot()))
+
+    def write_header(self):
+        self.f.seek(0)
+        self.f.write(HEADER.pack(MAGIC, VERSION, self.steps_num, self.count))
+        self.f.flush()
+
+    def index(self):
+        """ファイルに書いたエピソードの (エピソード番号, flags) を順に返す"""
+        for i in range(self.count):
+            self.f.seek(HEADER.size + i * self.record_size)
+            episode, flags, _ = RECORD.unpack(self.f.read(RECORD.size))
+            yield episode, flags
+
+    def append(self, episode, flags, ret, data):
+        """エピソードを 1 つ末尾に書いてから count を書き直す"""
+        self.f.seek(HEADER.size + self.count * self.record_size)
+        self.f.write(RECORD.pack(episode, flags, ret))
+        for buf in data:
+            if sys.byteorder == "big":
+                buf = array("d", buf)
+                buf.byteswap()
+            self.f.write(buf)
+        self.f.flush()
+        self.count += 1
+        self.write_header()
+
+    def close(self):
+        """上位・下位のエピソードを書いてファイルを閉じる
+
+        一定間隔で書いたエピソードと重なるものはそのレコードの flags に足すだけにする．
+        """
+        kept = {}
+        for ret, episode, data in self.best:
+            kept.setdefault(episode, [0, ret, data])[0] |= BEST
+        for neg_ret, neg_episode, data in self.worst:
+            kept.setdefault(-neg_episode, [0, -neg_ret, data])[0] |= WORST
+
+        if kept:
+            written = {episode: (i, flags) for i, (episode, flags) in enumerate(self.index())}
+            for episode in sorted(kept):
+                flags, ret, data = kept[episode]
+                if episode in written:
+                    i, old_flags = written[episode]
+                    self.f.seek(HEADER.size + i * self.record_size)
+                    self.f.write(RECORD.pack(episode, old_flags | flags, ret))
+                else:
+                    self.append(episode, flags, ret, data)
+
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
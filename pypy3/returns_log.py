@@ -0,0 +1,59 @@
+import sys
+from array import array
+
+
+class ReturnsWriter:
+    """エピソードごとの収益を float64 (little endian) の生バイナリで少しずつ書き出す
+
+    chunk_size 個たまるごとにファイルへ書き出して flush するので，
+    メモリ使用量はエピソード数によらず一定で，途中で落ちてもそこまでの分は残る．
+    書き出したファイルは numpy.memmap(fname, dtype="<f8") でそのまま読める．
+
+    start > 0 なら既存のファイルの先頭 start 個を残してその続きから書く (checkpoint からの再開用)．
+    """
+
+    def __init__(self, fname, chunk_size=1 << 16, start=0):
+        if start > 0:
+            self.f = open(fname, "r+b")
+            self.f.seek(0, 2)
+            if self.f.tell() < start * 8:
+                self.f.close()
+                raise ValueError(f"{fname} has fewer than {start} returns")
+            self.f.truncate(start * 8)
+            self.f.seek(start * 8)
+        else:
+            self.f = open(fname, "wb")
+        self.chunk_size = chunk_size
+        self.buf = array("d")
+
+    def append(self, r):
+        self.buf.append(r)
+        if len(self.buf) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if sys.byteorder == "big":
+            self.buf.byteswap()
+        self.buf.tofile(self.f)
+        self.f.flush()
+        del self.buf[:]
+
+    def close(self):
+        self.flush()
+        self.f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_returns(fname):
+    """ReturnsWriter で書き出したファイルを array で読む"""
+    returns = array("d")
+    with open(fname, "rb") as f:
+        returns.frombytes(f.read())
+    if sys.byteorder == "big":
+        returns.byteswap()
+    return returns
@@ -0,0 +1,143 @@
+"""Agent の eps-greedy で使う乱数
+
+どれも random() ([0, 1) の一様乱数) と randrange(n) を持つ．
+random() は block をつないだ iterator の __next__ そのものなので，1 回の呼び出しが C の中で終わる．
+
+    stdlib    グローバルの random モジュールそのもの (seed があれば random.seed(seed) する)
+              状態は checkpoint が保存するグローバルの random にだけある
+    buffered  NumPy の Generator (PCG64) で block 個ずつまとめて引いておく
+    sfmt      c_*_sfmt と同じ SFMT19937 (sfmt_init_gen_rand, sfmt_genrand_real2)
+"""
+
+from array import array
+import itertools
+import random
+import sys
+
+
+BLOCK_SIZE = 1 << 16
+
+
+class BlockRandom:
+    """blocks() が返す乱数のリストを順に 1 つずつ返す"""
+
+    def __init__(self):
+        self.random = itertools.chain.from_iterable(self.blocks()).__next__
+
+    def blocks(self):
+        raise NotImplementedError
+
+    def randrange(self, n):
+        """c_*_sfmt の floor(sfmt_genrand_real2(sfmt) * n) と同じ"""
+        return int(self.random() * n)
+
+
+class BufferedRandom(BlockRandom):
+    def __init__(self, seed=None, block_size=BLOCK_SIZE):
+        import numpy as np
+
+        self.generator = np.random.default_rng(seed)
+        self.block_size = block_size
+        super().__init__()
+
+    def blocks(self):
+        while True:
+            yield self.generator.random(self.block_size).tolist()
+
+
+class SfmtRandom(BlockRandom):
+    """SFMT19937 の 128 bit の状態を Python の int 1 つで持つ
+
+    u[0] が下位 32 bit (little endian の w128_t と同じ並び)．
+    """
+
+    N = 156
+    N32 = N * 4
+    POS1 = 122
+    SL1 = 18
+    SL2 = 1
+    SR1 = 11
+    SR2 = 1
+    MSK = (0xdfffffef, 0xddfecb7f, 0xbffaffff, 0xbffffff6)
+    PARITY = (0x00000001, 0x00000000, 0x00000000, 0x13c9e684)
+
+    MASK32 = 0xffffffff
+    MASK128 = (1 << 128) - 1
+
+    def __init__(self, seed=None):
+        if seed is None:
+            seed = random.getrandbits(32)
+        self.state = self.init_gen_rand(seed & self.MASK32)
+
+        # 32 bit ごとのシフトと mask を 128 bit で一度にやるための定数
+        self.sr1_mask = self.pack([m & (self.MASK32 >> self.SR1) for m in self.MSK])
+        self.sl1_mask = self.pack([self.MASK32 << self.SL1 & self.MASK32] * 4)
+        super().__init__()
+
+    @classmethod
+    def pack(cls, u):
+        """32 bit の整数 4 つを 128 bit にまとめる"""
+        return u[0] | u[1] << 32 | u[2] << 64 | u[3] << 96
+
+    @classmethod
+    def init_gen_rand(cls, seed):
+        """sfmt_init_gen_rand"""
+        u = [seed]
+        for i in range(1, cls.N32):
+            x = u[-1]
+            u.append((1812433253 * (x ^ (x >> 30)) + i) & cls.MASK32)
+        cls.period_certification(u)
+        return [cls.pack(u[i:i + 4]) for i in range(0, cls.N32, 4)]
+
+    @classmethod
+    def period_certification(cls, u):
+        inner = 0
+        for i in range(4):
+            inner ^= u[i] & cls.PARITY[i]
+        if bin(inner).count("1") % 2 == 1:
+            return
+
+        for i in range(4):
+            work = 1
+            for j in range(32):
+                if work & cls.PARITY[i]:
+                    u[i] ^= work
+                    return
+                work <<= 1
+
+    def gen_rand_all(self):
+        """sfmt_gen_rand_all"""
+        st = self.state
+        n, pos1, mask128 = self.N, self.POS1, self.MASK128
+        sl1, sl2, sr1, sr2 = self.SL1, self.SL2 * 8, self.SR1, self.SR2 * 8
+        sr1_mask, sl1_mask = self.sr1_mask, self.sl1_mask
+
+        r1, r2 = st[n - 2], st[n - 1]
+        for i in range(n):
+            a = st[i]
+            b = st[i + pos1 - n] if i >= n - pos1 else st[i + pos1]
+            r = (a ^ (a << sl2 & mask128) ^ (b >> sr1 & sr1_mask) ^ (r1 >> sr2) ^
+                 (r2 << sl1 & sl1_mask))
+            st[i] = r
+            r1, r2 = r2, r
+
+    def blocks(self):
+        scale = 1.0 / 4294967296.0
+        while True:
+            self.gen_rand_all()
+            u = array("I", b"".join(w.to_bytes(16, "little") for w in self.state))
+            if sys.byteorder == "big":
+                u.byteswap()
+            yield [x * scale for x in u]
+
+
+def make_rng(kind="stdlib", seed=None):
+    if kind == "stdlib":
+        if seed is not None:
+            random.seed(seed)
+        return random
+    if kind == "buffered":
+        return BufferedRandom(seed)
+    if kind == "sfmt":
+        return SfmtRandom(seed)
+    raise ValueError(f"unknown rng: {kind}")
@@ -0,0 +1,104 @@
+"""実験の設定 (run spec) の読み込み
+
+設定ファイルは JSON か TOML (Python 3.11 以降) で，次のセクションを持つ．
+書かなかった項目は DEFAULT_SPEC の値になる．
+
+    experiment  Experiment のパラメータ (episodes_num, steps_num)
+    agent       agent.make_agent のパラメータ (backend, alpha, x_num, ...)
+    env         CartPole のパラメータ (g, M, m, l, fps, integrator, init_state)
+    convergence ConvergenceMonitor のパラメータ (書くと収益が伸びなくなったところで止める)
+    recorder    EpisodeRecorder のパラメータ (書くと学習中のエピソードの軌跡を残す)
+    output      出力ファイル名
+"""
+
+import copy
+import json
+import platform
+
+
+DEFAULT_SPEC = {
+    "experiment": {},
+    "agent": {},
+    "env": {},
+    "convergence": {},
+    "recorder": {},
+    "output": {
+        "returns": "returns.bin",
+        "states": "states.csv",
+        "actions": "actions.csv",
+        "rewards": "rewards.csv",
+        "checkpoint": "checkpoint.bin",
+        "policy": "policy.bin",
+        "spec": "spec.json",
+        "episodes": "episodes.bin",
+    },
+}
+
+# 出力に記録するパラメータ
+EXPERIMENT_PARAMS = ["episodes_num", "steps_num"]
+AGENT_PARAMS = ["alpha", "gamma", "epsilon", "init_qvalue", "actions",
+                "x_limits", "theta_limits", "xdot_limits", "thetadot_limits",
+                "x_num", "theta_num", "xdot_num", "thetadot_num", "rng_kind", "seed"]
+ENV_PARAMS = ["g", "M", "m", "l", "fps", "integrator", "init_state"]
+
+# 性能を見るための短い実行 (--profile-run)
+PROFILE_RUN_SPEC = {
+    "experiment": {"episodes_num": 1000},
+}
+
+
+def merge(base, override):
+    """base に override を再帰的に重ねた新しい dict"""
+    merged = copy.deepcopy(base)
+    for k, v in override.items():
+        if isinstance(v, dict) and isinstance(merged.get(k), dict):
+            merged[k] = merge(merged[k], v)
+        else:
+            merged[k] = copy.deepcopy(v)
+    return merged
+
+
+def read(fname):
+    if fname.endswith(".toml"):
+        import tomllib
+        with open(fname, "rb") as f:
+            return tomllib.load(f)
+
+    with open(fname) as f:
+        return json.load(f)
+
+
+def load(fname=None, profile_run=False):
+    """設定ファイル (なければデフォルト) を読んで完全な spec を返す"""
+    spec = copy.deepcopy(DEFAULT_SPEC)
+    if profile_run:
+        spec = merge(spec, PROFILE_RUN_SPEC)
+    if fname is not None:
+        spec = merge(spec, read(fname))
+        # save で書いた処理系の情報は記録用なので読むときは無視する
+        spec.pop("python", None)
+
+    unknown = set(spec) - set(DEFAULT_SPEC)
+    if unknown:
+        raise ValueError(f"unknown spec sections: {sorted(unknown)}")
+    return spec
+
+
+def resolve(spec, exp):
+    """spec に exp で実際に使われた値をすべて書き込んだものを返す"""
+    resolved = copy.deepcopy(spec)
+    resolved["experiment"].update({k: getattr(exp, k) for k in EXPERIMENT_PARAMS})
+    resolved["agent"].update({k: getattr(exp.agent, k) for k in AGENT_PARAMS})
+    resolved["env"].update({k: getattr(exp.env, k) for k in ENV_PARAMS})
+    return resolved
+
+
+def save(spec, fname):
+    """出力と一緒に置いておく，実際に使った spec と処理系"""
+    record = dict(spec, python={
+        "implementation": platform.python_implementation(),
+        "version": platform.python_version(),
+    })
+    with open(fname, "w") as f:
+        json.dump(record, f, indent=2)
+        f.write("\n")
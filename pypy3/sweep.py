@@ -0,0 +1,134 @@
+"""ハイパーパラメータとシードの組み合わせを並列に実験する
+
+Usage: python3 sweep.py [--agent-grid JSON] [--env-grid JSON] [--seeds N ...]
+                        [--episodes N] [-j N] [--out DIR]
+
+例: python3 sweep.py --agent-grid '{"alpha": [0.1, 0.2]}' --seeds 0 1 2 --episodes 10000
+"""
+
+import argparse
+import concurrent.futures
+import itertools
+import json
+import os
+import random
+
+import numpy as np
+
+import experiment
+
+
+RETURNS_FNAME = "sweep_returns.npy"
+AGGREGATE_FNAME = "sweep_aggregate.npy"
+SUMMARY_FNAME = "sweep_summary.json"
+
+# aggregate の 2 軸目の並び
+STATS = ["mean", "p10", "p50", "p90"]
+
+
+def make_grid(grid):
+    """{"alpha": [0.1, 0.2], ...} を全組み合わせの dict のリストにする"""
+    keys = sorted(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+
+def make_runs(agent_grid, env_grid, seeds):
+    """(agent_params, env_params) の設定のリストと (設定の index, seed) のリストを返す"""
+    configs = list(itertools.product(make_grid(agent_grid), make_grid(env_grid)))
+    runs = [(i, seed) for i in range(len(configs)) for seed in seeds]
+    return configs, runs
+
+
+def run_one(agent_params, env_params, episodes_num, seed):
+    """worker で 1 つの Experiment を回して収益の列を返す"""
+    # worker ごとに乱数を明示的に初期化する
+    random.seed(seed)
+
+    exp = experiment.Experiment(agent_params, env_params)
+    exp.episodes_num = episodes_num
+    return exp.run()
+
+
+def run_sweep(configs, runs, episodes_num, workers, out_dir):
+    """全 run を並列に実行し，終わった順に (runs, episodes) の npy に書き込む"""
+    store = np.lib.format.open_memmap(
+        os.path.join(out_dir, RETURNS_FNAME), mode="w+", shape=(len(runs), episodes_num))
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for run_idx, (config_idx, seed) in enumerate(runs):
+            agent_params, env_params = configs[config_idx]
+            future = executor.submit(run_one, agent_params, env_params, episodes_num, seed)
+            futures[future] = run_idx
+
+        for future in concurrent.futures.as_completed(futures):
+            run_idx = futures[future]
+            store[run_idx] = np.frombuffer(future.result())
+            store.flush()
+            config_idx, seed = runs[run_idx]
+            print(f"done: config={config_idx} seed={seed}", flush=True)
+
+    return store
+
+
+def aggregate(store, configs, runs, chunk_size=1 << 16):
+    """設定ごとにシード方向の mean / percentile をとる
+
+    shape = (configs, len(STATS), episodes)
+    """
+    episodes_num = store.shape[1]
+    result = np.empty((len(configs), len(STATS), episodes_num))
+
+    for config_idx in range(len(configs)):
+        rows = [i for i, (c, _) in enumerate(runs) if c == config_idx]
+        # 全部メモリに載せないように episode 方向に区切って計算する
+        for start in range(0, episodes_num, chunk_size):
+            block = store[rows, start:start + chunk_size]
+            result[config_idx, 0, start:start + chunk_size] = block.mean(axis=0)
+            result[config_idx, 1:, start:start + chunk_size] = \
+                np.percentile(block, [10, 50, 90], axis=0)
+
+    return result
+
+
+def summarize(agg, configs, runs, tail_ratio=0.01):
+    """最後の tail_ratio 分のエピソードでの各統計量の平均"""
+    tail = max(1, int(agg.shape[2] * tail_ratio))
+    summary = []
+    for config_idx, (agent_params, env_params) in enumerate(configs):
+        final = agg[config_idx, :, -tail:].mean(axis=1)
+        summary.append({
+            "agent_params": agent_params,
+            "env_params": env_params,
+            "seeds": [seed for c, seed in runs if c == config_idx],
+            "final": dict(zip(STATS, final.tolist())),
+        })
+    return summary
+
+
+if __name__ == "__main__":
+    # コマンドライン引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--agent-grid", help="Agent parameters grid (JSON)",
+                        type=json.loads, default={})
+    parser.add_argument("--env-grid", help="CartPole parameters grid (JSON)",
+                        type=json.loads, default={})
+    parser.add_argument("--seeds", help="random seeds", type=int, nargs="+", default=[0])
+    parser.add_argument("--episodes", help="episodes per run", type=int, default=10000000)
+    parser.add_argument("-j", help="max processes", type=int, default=os.cpu_count())
+    parser.add_argument("--out", help="output directory", default=".")
+    args = parser.parse_args()
+
+    configs, runs = make_runs(args.agent_grid, args.env_grid, args.seeds)
+    store = run_sweep(configs, runs, args.episodes, args.j, args.out)
+
+    agg = aggregate(store, configs, runs)
+    np.save(os.path.join(args.out, AGGREGATE_FNAME), agg)
+
+    summary = summarize(agg, configs, runs)
+    with open(os.path.join(args.out, SUMMARY_FNAME), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    for s in summary:
+        final = " ".join(f"{k}={v:.3f}" for k, v in s["final"].items())
+        print(f"{s['agent_params']} {s['env_params']}: {final}")
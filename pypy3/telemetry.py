@@ -0,0 +1,78 @@
+"""学習中の途中経過を JSON lines で書き出す"""
+
+import json
+import os
+import resource
+import sys
+import time
+
+
+def rss_bytes():
+    """現在の常駐メモリ量 (取れなければ最大常駐メモリ量)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux は KB, macOS は bytes
+        return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class Telemetry:
+    """Experiment.run の hook として every エピソードごとに 1 行書き出す
+
+    毎エピソードの仕事は収益の足し算だけで，重い集計 (Q-table の走査など) は
+    every エピソードに 1 回しかしない．
+    学習が終わったら finish を呼ぶと，every に満たない最後の区間も書き出す．
+    """
+
+    def __init__(self, out=sys.stderr, every=1000):
+        self.out = out
+        self.every = every
+
+        self.start_time = time.perf_counter()
+        self.last_time = self.start_time
+        self.last_episode = None
+        self.last_explore_count = 0
+        self.returns_sum = 0.0
+
+    def __call__(self, exp, episode, ret):
+        self.returns_sum += ret
+        if self.last_episode is None:
+            # 再開したときはその位置から数える
+            self.last_episode = episode - 1
+            self.last_explore_count = exp.agent.explore_count
+        if episode % self.every == 0:
+            self.emit(exp, episode)
+
+    def finish(self, exp, episode):
+        """episode 個のエピソードで学習が終わったところで呼ぶ (途中で止めたときも)"""
+        if self.last_episode is not None and episode > self.last_episode:
+            self.emit(exp, episode)
+
+    def emit(self, exp, episode):
+        now = time.perf_counter()
+        elapsed = now - self.last_time
+        episodes = episode - self.last_episode
+        steps = episodes * exp.steps_num
+        agent = exp.agent
+        explore_count = agent.explore_count - self.last_explore_count
+
+        record = {
+            "episode": episode,
+            "elapsed_sec": now - self.start_time,
+            "episodes_per_sec": episodes / elapsed,
+            "steps_per_sec": steps / elapsed,
+            "mean_return": self.returns_sum / episodes,
+            "visited_states_ratio": agent.visited_states_num() / agent.states_num(),
+            "explore_ratio": explore_count / steps,
+            "rss_bytes": rss_bytes(),
+        }
+        self.out.write(json.dumps(record) + "\n")
+        self.out.flush()
+
+        # 集計にかかった時間は次の区間に含めない
+        self.last_time = time.perf_counter()
+        self.last_episode = episode
+        self.last_explore_count = agent.explore_count
+        self.returns_sum = 0.0
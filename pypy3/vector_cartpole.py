@@ -0,0 +1,67 @@
+import numpy as np
+
+import cartpole
+
+
+class VectorCartPole:
+    """N 台のカートを NumPy でまとめて動かす CartPole"""
+
+    def __init__(self, n, **params):
+        # 物理定数は CartPole からもらう
+        env = cartpole.CartPole(**params)
+        self.g = env.g
+        self.M = env.M
+        self.m = env.m
+        self.l = env.l
+        self.fps = env.fps
+        self.tau = env.tau
+        self.ml = env.ml
+        self.mass = env.mass
+        self.init_state = env.init_state
+
+        self.n = n
+
+        # ここで self.s をつくる
+        # shape = (n, 4), 各行が [x, theta, xdot, thetadot]
+        self.reset_state()
+
+    def step(self, a):
+        """a は shape = (n,) の力"""
+        self.s = self.runge_kutta_solve(self.s, a, self.tau)
+
+    def state(self):
+        return self.s
+
+    def reward(self):
+        x = self.s[:, 0]
+        theta = self.s[:, 1]
+        return np.where(np.abs(x) > cartpole.X_LIMIT, -2.0, -np.abs(theta) + np.pi / 2)
+
+    def reset_state(self):
+        self.s = np.tile(np.array(self.init_state, dtype=np.float64), (self.n, 1))
+
+    def differential(self, s, u):
+        """状態 s で力 u を加えたときの微分"""
+        theta = s[:, 1]
+        thetadot = s[:, 3]
+        sintheta = np.sin(theta)
+        costheta = np.cos(theta)
+
+        sdot = np.empty_like(s)
+        sdot[:, 0] = s[:, 2]
+        sdot[:, 1] = thetadot
+        sdot[:, 2] = (4 * u / 3 + 4 * self.ml * thetadot**2 * sintheta / 3 - self.m *
+                      self.g * np.sin(2*theta) / 2) / (4 * self.mass - self.m * costheta**2)
+        sdot[:, 3] = (self.mass * self.g * sintheta - self.ml * thetadot**2 * sintheta *
+                      costheta - u * costheta) / (4 * self.mass * self.l / 3 - self.ml * costheta**2)
+        return sdot
+
+    def runge_kutta_solve(self, s, u, dt):
+        k1 = self.differential(s, u)
+        k2 = self.differential(s + k1 * (dt / 2), u)
+        k3 = self.differential(s + k2 * (dt / 2), u)
+        k4 = self.differential(s + k3 * dt, u)
+
+        snext = s + (k1 + 2 * k2 + 2 * k3 + k4) * dt / 6
+        snext[:, 1] = (snext[:, 1] + np.pi) % (2 * np.pi) - np.pi
+        return snext
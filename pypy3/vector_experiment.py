@@ -0,0 +1,109 @@
+from array import array
+
+import numpy as np
+
+import agent
+import vector_cartpole
+
+
+def get_s_idx(ag, s):
+    """shape = (n, 4) の状態をまとめて Agent.get_s_idx と同じ index に変換する"""
+    # side="right" で Agent.digitize と同じ境界の扱いになる
+    x_idx = np.searchsorted(ag.x_bins, s[:, 0], side="right")
+    theta_idx = np.searchsorted(ag.theta_bins, s[:, 1], side="right")
+    xdot_idx = np.searchsorted(ag.xdot_bins, s[:, 2], side="right")
+    thetadot_idx = np.searchsorted(ag.thetadot_bins, s[:, 3], side="right")
+    return x_idx + ag.x_num * (theta_idx + ag.theta_num * (xdot_idx + ag.xdot_num * thetadot_idx))
+
+
+class VectorExperiment:
+    """N レーンの CartPole を同時に動かして学習する
+
+    shared = False ならレーンごとに別の Agent (Q-table) を学習し，
+    shared = True なら全レーンで 1 つの Q-table を共有する．
+    学習は dense な Q-table での Q 学習だけなので，backend は "dense" しか使えない．
+    """
+
+    def __init__(self, lanes_num, shared=False, seed=None, agent_params=None, env_params=None):
+        self.lanes_num = lanes_num
+        self.shared = shared
+        self.rng = np.random.default_rng(seed)
+
+        self.env = vector_cartpole.VectorCartPole(lanes_num, **(env_params or {}))
+
+        # Q-table は下でまとめて確保するので，ここでは空の表を渡しておく
+        agent_params = dict(agent_params or {}, qtable=array("d"))
+        first = agent.make_agent(**agent_params)
+        if first.backend != "dense":
+            raise ValueError(
+                f"VectorExperiment supports only the dense backend, not {first.backend}")
+        self.agents = [first] + [agent.make_agent(**dict(agent_params, qtable=array("d")))
+                                 for _ in range(0 if shared else lanes_num - 1)]
+
+        # 全体のエピソード数が Experiment と同じになるようにする
+        self.episodes_num = 10000000 // lanes_num
+        self.steps_num = self.env.fps * 10
+
+        # ハイパーパラメータと bins はどの Agent も同じ
+        ag = self.agents[0]
+        self.alpha = ag.alpha
+        self.gamma = ag.gamma
+        self.epsilon = ag.epsilon
+        self.actions = np.array(ag.actions)
+
+        # Q-table をまとめて持つ
+        # shape = (Q-table の数, states, actions), shared なら Q-table は 1 つ
+        shape = (len(self.agents), ag.states_num(), len(ag.actions))
+        self.qtables = np.full(shape, ag.init_qvalue)
+
+        # 各 Agent の Q-table は qtables の view なので，学習した値がそのまま見える
+        for ag, qtable in zip(self.agents, self.qtables):
+            ag.qtable = memoryview(qtable.reshape(-1))
+
+        # 各レーンがどの Q-table を使うか
+        if shared:
+            self.table_idx = np.zeros(lanes_num, dtype=np.intp)
+        else:
+            self.table_idx = np.arange(lanes_num)
+
+    def run(self):
+        """returns は shape = (episodes_num, lanes_num)"""
+        returns = np.empty((self.episodes_num, self.lanes_num))
+
+        for episode in range(self.episodes_num):
+            returns[episode] = self.one_episode()
+
+        return returns
+
+    def one_episode(self):
+        """全レーンで 1 エピソード進めて，レーンごとの収益を返す"""
+        env = self.env
+        qtables = self.qtables
+        table_idx = self.table_idx
+
+        env.reset_state()
+        s_idx = get_s_idx(self.agents[0], env.state())
+        ret = np.zeros(self.lanes_num)
+        r = np.zeros(self.lanes_num)
+
+        for step in range(self.steps_num):
+            ret += r
+
+            # eps-greedy
+            a_idx = np.argmax(qtables[table_idx, s_idx], axis=1)
+            explore = self.rng.random(self.lanes_num) < self.epsilon
+            a_idx[explore] = self.rng.integers(
+                len(self.actions), size=np.count_nonzero(explore))
+
+            env.step(self.actions[a_idx])
+            snext_idx = get_s_idx(self.agents[0], env.state())
+            r = env.reward()
+
+            # NOTE: shared のとき同じ (s, a) が複数レーンにあると最後の更新だけが残る
+            target = r + self.gamma * np.max(qtables[table_idx, snext_idx], axis=1)
+            qtables[table_idx, s_idx, a_idx] = \
+                (1.0 - self.alpha) * qtables[table_idx, s_idx, a_idx] + self.alpha * target
+
+            s_idx = snext_idx
+
+        return ret
@@ -0,0 +1,19 @@
+"""途中で落ちても前のファイルが壊れないように書く"""
+
+import contextlib
+import os
+
+
+@contextlib.contextmanager
+def replacing(fname):
+    """fname + ".tmp" を開いて渡し，書き終わったら fsync してから fname に rename する
+
+        with atomic_write.replacing(fname) as f:
+            f.write(data)
+    """
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "wb") as f:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_fname, fname)
@@ -0,0 +1,318 @@
+"""部品ごとの実行時間を測って JSON で出力する
+
+Usage: python3 bench.py [--repeats N] > bench.json
+
+乱数のシードと回数は固定してあるので，実行ごと・言語ごとに比較できる．
+"""
+
+import argparse
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+
+import agent
+import cartpole
+import experiment
+
+
+SEED = 0
+CALLS_NUM = 20000  # 部品ごとの呼び出し回数
+EPISODES_NUM = 10  # エピソードを測るときのエピソード数
+
+
+def make_states(n):
+    """ベンチで使う状態のリスト"""
+    rng = random.Random(SEED)
+    return [[rng.uniform(-2.5, 2.5), rng.uniform(-3.2, 3.2),
+             rng.uniform(-2.5, 2.5), rng.uniform(-11.0, 11.0)] for _ in range(n)]
+
+
+def bench_runge_kutta_solve():
+    env = cartpole.CartPole()
+    states = make_states(CALLS_NUM)
+    tau = env.tau
+
+    start = time.perf_counter()
+    for s in states:
+        env.runge_kutta_solve(s, 10.0, tau)
+    return time.perf_counter() - start, CALLS_NUM
+
+
+def bench_specialized_solve():
+    env = cartpole.CartPole()
+    solve = cartpole.make_specialized_solver(env, 10.0, env.tau)
+    states = make_states(CALLS_NUM)
+
+    start = time.perf_counter()
+    for s in states:
+        solve(s)
+    return time.perf_counter() - start, CALLS_NUM
+
+
+def check_specialized_solver():
+    """make_specialized_solver と runge_kutta_solve の差の最大値
+
+    theta は ±pi の境目で折り返しが分かれることがあるので 2pi を法として比べる
+    """
+    env = cartpole.CartPole()
+    max_error = 0.0
+    for u in (-10.0, 10.0):
+        solve = cartpole.make_specialized_solver(env, u, env.tau)
+        for s in make_states(CALLS_NUM):
+            expected = env.runge_kutta_solve(s, u, env.tau)
+            actual = solve(s)
+            errors = [abs(e - a) for e, a in zip(expected, actual)]
+            errors[1] = min(errors[1], abs(errors[1] - 2 * math.pi))
+            max_error = max(max_error, *errors)
+
+    if max_error > 1e-12:
+        raise AssertionError(f"specialized solver differs from runge_kutta_solve: {max_error}")
+    return max_error
+
+
+def bench_get_s_idx():
+    ag = agent.Agent()
+    states = make_states(CALLS_NUM)
+
+    start = time.perf_counter()
+    for s in states:
+        ag.get_s_idx(s)
+    return time.perf_counter() - start, CALLS_NUM
+
+
+def bench_action():
+    ag = agent.Agent()
+    states = make_states(CALLS_NUM)
+    random.seed(SEED)
+
+    start = time.perf_counter()
+    for s in states:
+        ag.action(s)
+    return time.perf_counter() - start, CALLS_NUM
+
+
+def bench_learn():
+    ag = agent.Agent()
+    states = make_states(CALLS_NUM + 1)
+
+    start = time.perf_counter()
+    for i in range(CALLS_NUM):
+        ag.learn(states[i], 10.0, 1.0, states[i + 1])
+    return time.perf_counter() - start, CALLS_NUM
+
+
+def bench_one_episode():
+    exp = experiment.Experiment()
+    random.seed(SEED)
+
+    start = time.perf_counter()
+    for _ in range(EPISODES_NUM):
+        exp.one_episode()
+    return time.perf_counter() - start, EPISODES_NUM * exp.steps_num
+
+
+def bench_train_episode():
+    exp = experiment.Experiment()
+    random.seed(SEED)
+
+    start = time.perf_counter()
+    for _ in range(EPISODES_NUM):
+        exp.train_episode()
+    return time.perf_counter() - start, EPISODES_NUM * exp.steps_num
+
+
+# 名前 -> (ベンチ関数, 1 回あたりの単位)
+BENCHES = {
+    "runge_kutta_solve": (bench_runge_kutta_solve, "call"),
+    "specialized_solve": (bench_specialized_solve, "call"),
+    "get_s_idx": (bench_get_s_idx, "call"),
+    "action": (bench_action, "call"),
+    "learn": (bench_learn, "call"),
+    "one_episode": (bench_one_episode, "step"),
+    "train_episode": (bench_train_episode, "step"),
+}
+
+
+# Q-table の持ち方の比較に使う状態の分割数 (x, theta, xdot, thetadot)
+QTABLE_GRIDS = [
+    (4, 40, 10, 50),
+    (10, 100, 20, 100),
+    (20, 200, 50, 200),
+]
+DENSE_LIMIT_BYTES = 1 << 30  # これより大きくなる dense な Q-table は測らない
+
+
+def bench_qtable(grid, backend):
+    """grid の分割で backend の Agent をつくって学習させたときの時間とメモリ"""
+    params = dict(zip(["x_num", "theta_num", "xdot_num", "thetadot_num"], grid))
+    params["backend"] = backend
+    random.seed(SEED)
+
+    start = time.perf_counter()
+    exp = experiment.Experiment(params)
+    setup = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(EPISODES_NUM):
+        exp.train_episode()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "setup_sec": setup,
+        "steps_per_sec": EPISODES_NUM * exp.steps_num / elapsed,
+        "memory_bytes": exp.agent.memory_bytes(),
+        "visited_states": exp.agent.visited_states_num(),
+        "states": exp.agent.states_num(),
+    }
+
+
+def run_qtable():
+    results = {}
+    for grid in QTABLE_GRIDS:
+        name = "x".join(map(str, grid))
+        results[name] = {}
+        for backend in ["dense", "lazy"]:
+            states_num = grid[0] * grid[1] * grid[2] * grid[3]
+            if backend == "dense" and states_num * 2 * 8 > DENSE_LIMIT_BYTES:
+                results[name][backend] = None
+                continue
+            results[name][backend] = bench_qtable(grid, backend)
+    return results
+
+
+# 到達時間を比べる学習器
+LEARNERS = {
+    "qlearning": {"backend": "dense"},
+    "qlambda": {"backend": "qlambda"},
+    "dyna": {"backend": "dyna", "planning_steps": 10},
+    "dyna50": {"backend": "dyna", "planning_steps": 50},
+    "tile": {"backend": "tile"},
+}
+ROLLING_WINDOW = 100  # 収益の移動平均の幅
+
+
+def bench_learner(agent_params, episodes_num, threshold):
+    """収益の移動平均が threshold に届くまでのエピソード数と時間"""
+    random.seed(SEED)
+    exp = experiment.Experiment(agent_params, episodes_num=episodes_num)
+
+    recent = []
+    start = time.perf_counter()
+    for episode in range(episodes_num):
+        recent.append(exp.train_episode())
+        if len(recent) > ROLLING_WINDOW:
+            recent.pop(0)
+        if len(recent) == ROLLING_WINDOW and sum(recent) / ROLLING_WINDOW >= threshold:
+            return {"reached": True, "episodes": episode + 1,
+                    "simulated_sec": (episode + 1) * exp.steps_num / exp.env.fps,
+                    "sec": time.perf_counter() - start,
+                    "memory_bytes": exp.agent.memory_bytes()}
+
+    return {"reached": False, "episodes": episodes_num,
+            "simulated_sec": episodes_num * exp.steps_num / exp.env.fps,
+            "sec": time.perf_counter() - start, "final_mean": sum(recent) / len(recent),
+            "memory_bytes": exp.agent.memory_bytes()}
+
+
+def run_learner(episodes_num, threshold):
+    """各学習器の到達時間と，qlearning に比べてシミュレーション時間・実時間が何分の 1 で済んだか"""
+    results = {name: bench_learner(params, episodes_num, threshold)
+               for name, params in LEARNERS.items()}
+
+    base = results["qlearning"]
+    for res in results.values():
+        if res["reached"] and base["reached"]:
+            res["simulated_gain"] = base["simulated_sec"] / res["simulated_sec"]
+            res["wall_gain"] = base["sec"] / res["sec"]
+    return results
+
+
+RNG_KINDS = ["stdlib", "buffered", "sfmt"]
+RNG_CALLS_NUM = 1 << 20  # 乱数の block をいくつかまたぐ回数
+
+
+def bench_rng(kind):
+    """kind の乱数での random() と eps-greedy の action_idx の時間"""
+    try:
+        ag = agent.Agent(rng_kind=kind, seed=SEED)
+    except ImportError:
+        return None  # NumPy がない処理系
+    rand = ag.rng.random
+    action_idx = ag.action_idx
+
+    start = time.perf_counter()
+    for _ in range(RNG_CALLS_NUM):
+        rand()
+    random_sec = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(RNG_CALLS_NUM):
+        action_idx(0)
+    action_sec = time.perf_counter() - start
+
+    return {
+        "random_per_sec": RNG_CALLS_NUM / random_sec,
+        "action_idx_per_sec": RNG_CALLS_NUM / action_sec,
+    }
+
+
+def run_rng():
+    return {kind: bench_rng(kind) for kind in RNG_KINDS}
+
+
+def measure(func, repeats):
+    """repeats 回測って 1 単位あたりの秒数の統計をとる"""
+    per_op = []
+    for _ in range(repeats):
+        elapsed, n = func()
+        per_op.append(elapsed / n)
+
+    median = statistics.median(per_op)
+    return {
+        "median_sec": median,
+        "variance": statistics.variance(per_op) if repeats > 1 else 0.0,
+        "per_sec": 1 / median,
+        "repeats": repeats,
+        "samples": per_op,
+    }
+
+
+def run(repeats):
+    results = {}
+    for name, (func, unit) in BENCHES.items():
+        results[name] = measure(func, repeats)
+        results[name]["unit"] = unit
+    return results
+
+
+if __name__ == "__main__":
+    # コマンドライン引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", help="repeats per benchmark", type=int, default=5)
+    parser.add_argument("--suite", help="benchmark suite",
+                        choices=["components", "qtable", "learner", "rng"], default="components")
+    parser.add_argument("--episodes", help="max episodes (learner suite)", type=int, default=20000)
+    parser.add_argument("--threshold", help="target rolling mean return (learner suite)",
+                        type=float, default=-600.0)
+    args = parser.parse_args()
+
+    report = {
+        "implementation": platform.python_implementation(),
+        "version": platform.python_version(),
+    }
+    if args.suite == "components":
+        report["specialized_max_error"] = check_specialized_solver()
+        report["results"] = run(args.repeats)
+    elif args.suite == "qtable":
+        report["qtable"] = run_qtable()
+    elif args.suite == "rng":
+        report["rng"] = run_rng()
+    else:
+        report["threshold"] = args.threshold
+        report["learner"] = run_learner(args.episodes, args.threshold)
+    json.dump(report, sys.stdout, indent=2)
+    print()
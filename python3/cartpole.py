@@ -1,42 +1,99 @@
-from copy import copy
 from math import sin, cos, pi
 
 
+X_LIMIT = 2.0  # カートの位置の絶対値がこれを超えると範囲外 (報酬 -2)
+
+
 class CartPole:
-    def __init__(self):
+    def __init__(self, **params):
         self.g = 9.80665  # 重力加速度
         self.M = 1.0  # カートの質量
         self.m = 0.1  # ポールの質量
         self.l = 0.5  # ポールの半分の長さ
         self.fps = 50  # frames per second
+        self.integrator = "runge_kutta"  # "runge_kutta" か "specialized"
+        self.init_state = [0.0, -pi, 0.0, 0.0]  # エピソード開始時の状態
+
+        # 上のパラメータを上書きする
+        for k, v in params.items():
+            if not hasattr(self, k):
+                raise AttributeError(f"unknown env parameter: {k}")
+            setattr(self, k, v)
+
         self.tau = 1 / self.fps  # 制御周期
 
         # 後の計算で使う
         self.ml = self.m * self.l
         self.mass = self.M + self.m
 
+        # 積分器の選択
+        if self.integrator == "specialized":
+            self.specialized_solvers = {}  # 力 u -> make_specialized_solver の結果
+            self.step = self.specialized_step
+        elif self.integrator != "runge_kutta":
+            raise ValueError(f"unknown integrator: {self.integrator}")
+
         # ここで self.s をつくる
         # [x, theta, xdot, thetadot]
         self.reset_state()
 
     def step(self, a):
-        self.s = self.runge_kutta_solve(self.s, a, self.tau)
+        """runge_kutta_solve と同じ計算で，途中の list をつくらずに self.s をその場で書き換える"""
+        s = self.s
+        dt = self.tau
+        half_dt = dt / 2
+        accel = self.accel
+        x, theta, xdot, thetadot = s
+
+        # k1 = [xdot, thetadot, xddot1, thetaddot1]
+        xddot1, thetaddot1 = accel(theta, thetadot, a)
+        # k2 = [xdot2, thetadot2, xddot2, thetaddot2]
+        xdot2 = xdot + xddot1 * half_dt
+        thetadot2 = thetadot + thetaddot1 * half_dt
+        xddot2, thetaddot2 = accel(theta + thetadot * half_dt, thetadot2, a)
+        # k3
+        xdot3 = xdot + xddot2 * half_dt
+        thetadot3 = thetadot + thetaddot2 * half_dt
+        xddot3, thetaddot3 = accel(theta + thetadot2 * half_dt, thetadot3, a)
+        # k4
+        xdot4 = xdot + xddot3 * dt
+        thetadot4 = thetadot + thetaddot3 * dt
+        xddot4, thetaddot4 = accel(theta + thetadot3 * dt, thetadot4, a)
+
+        s[0] = x + (xdot + 2 * xdot2 + 2 * xdot3 + xdot4) * dt / 6
+        theta = theta + (thetadot + 2 * thetadot2 + 2 * thetadot3 + thetadot4) * dt / 6
+        s[1] = (theta + pi) % (2 * pi) - pi
+        s[2] = xdot + (xddot1 + 2 * xddot2 + 2 * xddot3 + xddot4) * dt / 6
+        s[3] = thetadot + (thetaddot1 + 2 * thetaddot2 + 2 * thetaddot3 + thetaddot4) * dt / 6
+
+    def specialized_step(self, a):
+        """力 a 専用の積分器で進める"""
+        solve = self.specialized_solvers.get(a)
+        if solve is None:
+            solve = self.specialized_solvers[a] = make_specialized_solver(self, a, self.tau)
+        self.s[:] = solve(self.s)
 
     def state(self):
-        return self.s
+        # step で self.s が書き換わっても影響しないようにコピーを返す
+        return list(self.s)
 
     def reward(self):
         x, theta, xdot, thetadot = self.s
-        if abs(x) > 2.0:
+        if abs(x) > X_LIMIT:
             return -2.0
         return -abs(theta) + pi / 2
 
     def reset_state(self):
-        self.s = [0.0, -pi, 0.0, 0.0]
+        self.s = list(self.init_state)
 
     def differential(self, s, u):
         """状態 s で力 u を加えたときの微分"""
         x, theta, xdot, thetadot = s
+        xddot, thetaddot = self.accel(theta, thetadot, u)
+        return [xdot, thetadot, xddot, thetaddot]
+
+    def accel(self, theta, thetadot, u):
+        """(theta, thetadot) で力 u を加えたときの (xddot, thetaddot)"""
         sintheta = sin(theta)
         costheta = cos(theta)
 
@@ -45,7 +102,7 @@ class CartPole:
         thetaddot = (self.mass * self.g * sintheta - self.ml * thetadot**2 * sintheta *
                      costheta - u * costheta) / (4 * self.mass * self.l / 3 - self.ml * costheta**2)
 
-        return [xdot, thetadot, xddot, thetaddot]
+        return xddot, thetaddot
 
     def euler_solve(self, s, sdot, dt):
         """オイラー法を用いて微分方程式を解く"""
@@ -60,9 +117,63 @@ class CartPole:
         s3 = self.euler_solve(s, k3, dt)
         k4 = self.differential(s3, u)
 
-        snext = copy(s)
-        for i in range(len(s)):
-            snext[i] += (k1[i] + 2 * k2[i] + 2 * k3[i] + k4[i]) * dt / 6
+        snext = [s[i] + (k1[i] + 2 * k2[i] + 2 * k3[i] + k4[i]) * dt / 6 for i in range(len(s))]
 
         snext[1] = (snext[1] + pi) % (2 * pi) - pi
         return snext
+
+
+def make_specialized_solver(env, u, dt):
+    """力 u と刻み幅 dt を固定した runge_kutta_solve と同じ計算をする関数をつくる
+
+    定数はすべてクロージャに閉じ込め，sin(2θ) は 2 sinθ cosθ として計算する．
+    runge_kutta_solve との差は 1e-12 以内．
+    """
+    # differential の式を定数ごとにまとめておく
+    xddot_u = 4 * u / 3
+    xddot_c1 = 4 * env.ml / 3
+    xddot_c2 = env.m * env.g  # m g sin(2θ) / 2 = m g sinθ cosθ
+    xddot_c3 = 4 * env.mass
+    m = env.m
+    thetaddot_c1 = env.mass * env.g
+    ml = env.ml
+    thetaddot_c2 = 4 * env.mass * env.l / 3
+    half_dt = dt / 2
+    two_pi = 2 * pi
+
+    def accel(theta, thetadot):
+        """状態 (theta, thetadot) での (xddot, thetaddot)"""
+        sintheta = sin(theta)
+        costheta = cos(theta)
+        thetadot2_sin = thetadot * thetadot * sintheta
+        cos2 = costheta * costheta
+        return ((xddot_u + xddot_c1 * thetadot2_sin - xddot_c2 * sintheta * costheta) /
+                (xddot_c3 - m * cos2),
+                (thetaddot_c1 * sintheta - ml * thetadot2_sin * costheta - u * costheta) /
+                (thetaddot_c2 - ml * cos2))
+
+    def solve(s):
+        x, theta, xdot, thetadot = s
+
+        # k1 = [xdot, thetadot, xddot1, thetaddot1]
+        xddot1, thetaddot1 = accel(theta, thetadot)
+        # k2 = [xdot2, thetadot2, xddot2, thetaddot2]
+        xdot2 = xdot + xddot1 * half_dt
+        thetadot2 = thetadot + thetaddot1 * half_dt
+        xddot2, thetaddot2 = accel(theta + thetadot * half_dt, thetadot2)
+        # k3
+        xdot3 = xdot + xddot2 * half_dt
+        thetadot3 = thetadot + thetaddot2 * half_dt
+        xddot3, thetaddot3 = accel(theta + thetadot2 * half_dt, thetadot3)
+        # k4
+        xdot4 = xdot + xddot3 * dt
+        thetadot4 = thetadot + thetaddot3 * dt
+        xddot4, thetaddot4 = accel(theta + thetadot3 * dt, thetadot4)
+
+        theta += (thetadot + 2 * thetadot2 + 2 * thetadot3 + thetadot4) * dt / 6
+        return (x + (xdot + 2 * xdot2 + 2 * xdot3 + xdot4) * dt / 6,
+                (theta + pi) % two_pi - pi,
+                xdot + (xddot1 + 2 * xddot2 + 2 * xddot3 + xddot4) * dt / 6,
+                thetadot + (thetaddot1 + 2 * thetaddot2 + 2 * thetaddot3 + thetaddot4) * dt / 6)
+
+    return solve
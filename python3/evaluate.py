@@ -0,0 +1,101 @@
+"""学習済みの Agent を多数のエピソードでまとめて評価する"""
+
+from math import pi
+
+import numpy as np
+
+import cartpole
+import vector_cartpole
+import vector_experiment
+
+
+# 状態 × 行動の dense な Q-table (float64 の配列) を持つ backend
+BACKENDS = ("dense", "qlambda", "dyna")
+
+
+class EvaluationResult:
+    def __init__(self, returns, success):
+        self.returns = returns  # shape = (n_episodes,) の収益
+        self.success = success  # shape = (n_episodes,) の bool, 倒立を保てたか
+
+    def mean(self):
+        return float(np.mean(self.returns))
+
+    def std(self):
+        return float(np.std(self.returns))
+
+    def success_rate(self):
+        return float(np.mean(self.success))
+
+    def summary(self):
+        return {
+            "episodes": len(self.returns),
+            "mean": self.mean(),
+            "std": self.std(),
+            "min": float(np.min(self.returns)),
+            "max": float(np.max(self.returns)),
+            "success_rate": self.success_rate(),
+        }
+
+
+def uniform_start(low, high):
+    """[low, high) の一様分布から初期状態をとる start_distribution をつくる
+
+    low, high は [x, theta, xdot, thetadot]
+    """
+    def start(rng, n):
+        return rng.uniform(low, high, size=(n, 4))
+    return start
+
+
+def evaluate(agent, n_episodes, start_distribution=None, steps_num=None, seed=None,
+             env_params=None, batch_size=4096, upright_angle=pi / 12, hold_sec=1.0):
+    """agent の greedy 方策で n_episodes エピソードをまとめて動かす
+
+    start_distribution(rng, n) は shape = (n, 4) の初期状態を返す関数．
+    None なら Experiment と同じく env_params の init_state から始める．
+    最後の hold_sec 秒間ポールが upright_angle 以内に立ち，カートが範囲内 (報酬と同じ cartpole.X_LIMIT) にあれば成功とする．
+    収益の数え方は Experiment.train_episode と同じ．
+    """
+    if agent.backend not in BACKENDS:
+        raise TypeError(f"evaluate needs a dense Q-table; the {agent.backend} backend is not supported")
+
+    rng = np.random.default_rng(seed)
+    qtable = np.frombuffer(agent.qtable, dtype=np.float64).reshape(-1, len(agent.actions))
+    actions = np.array(agent.actions)
+
+    returns = np.empty(n_episodes)
+    success = np.empty(n_episodes, dtype=bool)
+
+    for start in range(0, n_episodes, batch_size):
+        n = min(batch_size, n_episodes - start)
+        env = vector_cartpole.VectorCartPole(n, **(env_params or {}))
+        if steps_num is None:
+            steps_num = env.fps * 10
+        hold_steps = int(env.fps * hold_sec)
+
+        if start_distribution is None:
+            env.reset_state()
+        else:
+            env.s = np.array(start_distribution(rng, n), dtype=np.float64)
+        ret = np.zeros(n)
+        r = np.zeros(n)
+        upright_steps = np.zeros(n, dtype=np.int64)
+
+        for step in range(steps_num):
+            ret += r
+
+            # greedy
+            s_idx = vector_experiment.get_s_idx(agent, env.state())
+            a_idx = np.argmax(qtable[s_idx], axis=1)
+            env.step(actions[a_idx])
+            r = env.reward()
+
+            s = env.state()
+            upright = (np.abs(s[:, 1]) < upright_angle) & (np.abs(s[:, 0]) <= cartpole.X_LIMIT)
+            upright_steps = np.where(upright, upright_steps + 1, 0)
+
+        returns[start:start + n] = ret
+        success[start:start + n] = upright_steps >= hold_steps
+
+    return EvaluationResult(returns, success)
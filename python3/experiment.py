@@ -1,3 +1,5 @@
+from array import array
+
 import agent
 import cartpole
 
@@ -10,45 +12,113 @@ class History:
 
 
 class Experiment:
-    def __init__(self):
-        self.agent = agent.Agent()
-        self.env = cartpole.CartPole()
+    def __init__(self, agent_params=None, env_params=None, **params):
+        self.agent = agent.make_agent(**(agent_params or {}))
+        self.env = cartpole.CartPole(**(env_params or {}))
 
         self.episodes_num = 10000000
         self.steps_num = self.env.fps * 10
 
-    def run(self):
-        returns = [None for _ in range(self.episodes_num)]
+        # 上のパラメータを上書きする
+        for k, v in params.items():
+            if not hasattr(self, k):
+                raise AttributeError(f"unknown experiment parameter: {k}")
+            setattr(self, k, v)
 
-        for episode in range(self.episodes_num):
-            hist = self.one_episode()
-            returns[episode] = sum(hist.rewards)
+    def run(self, returns_log=None, hooks=(), start_episode=0, recorder=None):
+        """returns_log (append を持つもの) に収益を流し込む
 
-        return returns
+        returns_log を渡さなければ array に溜めて返す．
+        hooks の各要素は毎エピソード hook(self, 終わったエピソード数, 収益) と呼ばれ，
+        どれかが True を返したらそのエピソードで学習をやめる (episodes_num もそこまでにする)．
+        checkpoint から再開するときは start_episode から始める．
+        recorder (recorder.EpisodeRecorder) を渡すと各エピソードの軌跡を記録する．
+        """
+        if returns_log is None:
+            returns_log = array("d")
 
-    def test(self):
-        self.agent.set_test_params()
-        return self.one_episode()
+        for episode in range(start_episode, self.episodes_num):
+            if recorder is None:
+                ret = self.train_episode()
+            else:
+                ret = self.record_episode(recorder)
+                recorder.select(episode + 1, ret)
+            returns_log.append(ret)
+            stop = False
+            for hook in hooks:
+                if hook(self, episode + 1, ret):
+                    stop = True
+            if stop:
+                self.episodes_num = episode + 1
+                break
 
-    def one_episode(self):
-        hist = History(self.steps_num)
+        return returns_log
+
+    def play_episode(self, learn=True, observe=None):
+        """1 エピソード動かして収益を返す (どのエピソードのループもこれを使う)
 
-        self.env.reset_state()
-        s = self.env.state()
+        learn = False なら乱数も学習も使わずに greedy 方策で動かす．
+        observe を渡すと，各ステップで行動する前に
+        observe(step, 状態, 1 つ前のステップの行動, 1 つ前のステップの報酬) と呼ぶ．
+        状態の list は env.s そのもので step で書き換わるので，残すならコピーする．
+        """
+        agent = self.agent
+        env = self.env
+
+        env.reset_state()
+        agent.start_episode()
+        s_idx = agent.get_s_idx(env.s)
+        ret = 0.0
         a = 0.0
         r = 0.0
 
         for step in range(self.steps_num):
-            hist.states[step] = s
-            hist.actions[step] = a
-            hist.rewards[step] = r
+            ret += r
+            if observe is not None:
+                observe(step, env.s, a, r)
+
+            if learn:
+                a_idx = agent.action_idx(s_idx)
+            else:
+                a_idx = agent.argmax(agent.qvalues(s_idx))
+            a = agent.actions[a_idx]
+            env.step(a)
+            snext_idx = agent.get_s_idx(env.s)
+            r = env.reward()
+            if learn:
+                agent.learn_idx(s_idx, a_idx, r, snext_idx)
+
+            s_idx = snext_idx
+
+        return ret
 
-            a = self.agent.action(s)
-            self.env.step(a)
-            s_next = self.env.state()
-            r = self.env.reward()
-            self.agent.learn(s, a, r, s_next)
+    def train_episode(self):
+        """History を作らずに 1 エピソード学習して収益を返す
 
-            s = s_next
+        one_episode で記録した rewards の和と同じ値になる
+        """
+        return self.play_episode()
+
+    def record_episode(self, recorder):
+        """train_episode と同じように学習しながら recorder のバッファに軌跡を書く
+
+        各ステップの値の並びは one_episode の History と同じ
+        (状態は行動する前のもの，行動と報酬は 1 つ前のステップのもの)．
+        """
+        return self.play_episode(observe=recorder.write)
+
+    def test(self):
+        self.agent.set_test_params()
+        return self.one_episode()
+
+    def one_episode(self, learn=True):
+        """1 エピソード動かして History を返す (learn は play_episode と同じ)"""
+        hist = History(self.steps_num)
+
+        def observe(step, s, a, r):
+            hist.states[step] = list(s)
+            hist.actions[step] = a
+            hist.rewards[step] = r
 
+        self.play_episode(learn, observe)
         return hist
@@ -0,0 +1,63 @@
+"""観測した遷移を覚えておいて再利用する Dyna-Q
+
+CartPole.step は 1 回ごとに Runge-Kutta の積分をするので重いが，
+Agent.learn では得た遷移を 1 回しか使わない．
+DynaAgent は離散化した遷移 (s_idx, a_idx) -> (r, snext_idx) を配列のモデルに覚えておき，
+実際の 1 ステップごとにモデルから planning_steps 個の遷移を引いてまとめて更新する．
+"""
+
+import random
+
+import numpy as np
+
+import agent
+
+
+class DynaAgent(agent.Agent):
+    # モデルと generator の状態は checkpoint に入らないので checkpoint はできない
+    backend = "dyna"
+
+    def __init__(self, **params):
+        self.planning_steps = 10  # 実際の 1 ステップごとのモデルからの更新回数
+        super().__init__(**params)
+
+        sa_num = self.states_num() * len(self.actions)
+        self.model_r = np.zeros(sa_num)  # sa_idx -> 最後に観測した報酬
+        self.model_snext = np.zeros(sa_num, dtype=np.int64)  # sa_idx -> 最後に観測した次状態
+        self.model_known = np.zeros(sa_num, dtype=bool)
+        self.observed = np.empty(sa_num, dtype=np.int64)  # 観測した sa_idx (観測順)
+        self.observed_num = 0
+
+        # seed がなければ random.seed で再現できるようにグローバルの random から決める
+        seed = random.getrandbits(64) if self.seed is None else self.seed
+        self.generator = np.random.default_rng(seed)
+
+    def learn_idx(self, s_idx, a_idx, r, snext_idx):
+        super().learn_idx(s_idx, a_idx, r, snext_idx)
+
+        sa_idx = s_idx * len(self.actions) + a_idx
+        if not self.model_known[sa_idx]:
+            self.model_known[sa_idx] = True
+            self.observed[self.observed_num] = sa_idx
+            self.observed_num += 1
+        self.model_r[sa_idx] = r
+        self.model_snext[sa_idx] = snext_idx
+
+        if self.planning_steps > 0 and self.alpha > 0.0:
+            self.plan()
+
+    def plan(self):
+        """観測済みの (s, a) を planning_steps 個引いてまとめて更新する
+
+        同じ (s, a) が重なったときは最後の 1 つだけが反映される．
+        """
+        q = np.frombuffer(self.qtable, dtype=np.float64)
+        qs = q.reshape(-1, len(self.actions))
+
+        sa = self.observed[self.generator.integers(self.observed_num, size=self.planning_steps)]
+        target = self.model_r[sa] + self.gamma * qs[self.model_snext[sa]].max(axis=1)
+        q[sa] = (1.0 - self.alpha) * q[sa] + self.alpha * target
+
+    def memory_bytes(self):
+        return super().memory_bytes() + (self.model_r.nbytes + self.model_snext.nbytes +
+                                         self.model_known.nbytes + self.observed.nbytes)
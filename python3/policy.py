@@ -0,0 +1,115 @@
+"""学習済みの方策 (Q-table と状態分割の情報) の保存と読み込み
+
+ファイルの中身 (すべて little endian)
+
+    magic          4 bytes  b"ARLP"
+    version        uint32
+    data offset    uint32   Q-table の先頭の位置 (64 の倍数)
+    actions num    uint32
+    states num     uint64
+    init qvalue    float64
+    backend        16 bytes 保存した Agent の backend 名 (utf-8, 0 埋め)
+    limits, num    (float64, float64, uint32, uint32 (padding)) * 4  x, theta, xdot, thetadot の順
+    actions        float64 * actions num
+    (padding)
+    qtable         float64 * states num * actions num
+
+読み込みは mmap するだけなので一瞬で終わり，複数のプロセスで同じページを共有できる．
+状態 × 行動の表になる Q-table (BACKENDS) だけを扱い，読み込むと Agent になる．
+"""
+
+import mmap
+import struct
+import sys
+from array import array
+
+import agent
+import atomic_write
+
+
+MAGIC = b"ARLP"
+VERSION = 2
+ALIGN = 64
+
+HEADER = struct.Struct("<4sIIIQd16s")
+DIM = struct.Struct("<ddII")
+DIMS = ["x", "theta", "xdot", "thetadot"]
+
+# 方策ファイルに書ける Agent の backend
+BACKENDS = ("dense", "lazy", "qlambda", "dyna")
+
+
+def supports(ag):
+    """ag の Q-table を方策ファイルに書けるか"""
+    return ag.backend in BACKENDS
+
+
+def save(ag, fname):
+    """ag の Q-table を fname に書く (一時ファイルに書いてから rename する)
+
+    LazyAgent の dict の Q-table は dense な表に展開して書く
+    """
+    if not supports(ag):
+        raise TypeError(f"policy files do not support the {ag.backend} backend")
+
+    actions_num = len(ag.actions)
+    meta = b"".join(DIM.pack(*getattr(ag, f"{d}_limits"), getattr(ag, f"{d}_num"), 0)
+                    for d in DIMS)
+    meta += struct.pack(f"<{actions_num}d", *ag.actions)
+    data_offset = -(-(HEADER.size + len(meta)) // ALIGN) * ALIGN
+    header = HEADER.pack(MAGIC, VERSION, data_offset, actions_num, ag.states_num(),
+                         ag.init_qvalue, ag.backend.encode())
+
+    qtable = ag.qtable
+    if isinstance(qtable, dict):
+        qtable = array("d", [ag.init_qvalue]) * (ag.states_num() * actions_num)
+        for s_idx, row in ag.qtable.items():
+            qtable[s_idx * actions_num:(s_idx + 1) * actions_num] = array("d", row)
+    if sys.byteorder == "big":
+        qtable = array("d", qtable)
+        qtable.byteswap()
+
+    with atomic_write.replacing(fname) as f:
+        f.write(header)
+        f.write(meta)
+        f.write(b"\0" * (data_offset - HEADER.size - len(meta)))
+        f.write(qtable)
+
+
+def load(fname, writable=False, **params):
+    """fname を mmap して，その Q-table をそのまま使う Agent を返す
+
+    writable = False なら読み込み専用 (learn すると TypeError)．
+    True ならコピーオンライトで，書いた部分だけがプロセスごとに複製されファイルは変わらない．
+    params はファイルにない Agent のパラメータ (alpha, epsilon など) の上書き．
+    """
+    if sys.byteorder == "big":
+        raise NotImplementedError("policy files are little endian")
+
+    with open(fname, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY if writable else mmap.ACCESS_READ)
+
+    magic, version, data_offset, actions_num, states_num, init_qvalue, backend = \
+        HEADER.unpack_from(mm)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"not a policy file (version {VERSION}): {fname}")
+    backend = backend.rstrip(b"\0").decode()
+    if backend not in BACKENDS:
+        raise ValueError(f"unsupported backend in policy file: {backend}: {fname}")
+
+    for i, d in enumerate(DIMS):
+        lo, hi, num, _ = DIM.unpack_from(mm, HEADER.size + i * DIM.size)
+        params[f"{d}_limits"] = [lo, hi]
+        params[f"{d}_num"] = num
+    bins_num = 1
+    for d in DIMS:
+        bins_num *= params[f"{d}_num"]
+    if states_num != bins_num:
+        raise ValueError(f"states num {states_num} does not match the bins ({bins_num}): {fname}")
+
+    actions = struct.unpack_from(f"<{actions_num}d", mm, HEADER.size + len(DIMS) * DIM.size)
+    params["actions"] = list(actions)
+    params["init_qvalue"] = init_qvalue
+
+    qtable = memoryview(mm)[data_offset:data_offset + states_num * actions_num * 8].cast("d")
+    return agent.Agent(qtable=qtable, **params)
@@ -0,0 +1,90 @@
+"""少ないエピソード数で学習を回して，どこに時間がかかっているかを調べる
+
+Usage: python3 profiling.py [--episodes N] [--spec FILE] [--collapsed]
+
+cProfile の結果を profile.pstats と関数ごとの表 profile.txt に書き出す．
+--collapsed をつけると，別にサンプリングでスタックを集めて
+flamegraph.pl や speedscope で読める profile.collapsed も書き出す．
+"""
+
+import argparse
+import collections
+import cProfile
+import os.path
+import pstats
+import random
+import signal
+
+import experiment
+import spec as run_spec
+
+
+PSTATS_FNAME = "profile.pstats"
+REPORT_FNAME = "profile.txt"
+COLLAPSED_FNAME = "profile.collapsed"
+SEED = 0
+REPORT_LINES = 40
+
+
+def make_experiment(spec_fname, episodes_num):
+    spec = run_spec.load(spec_fname)
+    spec["experiment"]["episodes_num"] = episodes_num
+    random.seed(SEED)
+    return experiment.Experiment(spec["agent"], spec["env"], **spec["experiment"])
+
+
+def run_cprofile(exp):
+    profiler = cProfile.Profile()
+    profiler.runcall(exp.run)
+    profiler.dump_stats(PSTATS_FNAME)
+
+    with open(REPORT_FNAME, "w") as f:
+        stats = pstats.Stats(profiler, stream=f)
+        stats.strip_dirs()
+        f.write("# sorted by tottime\n")
+        stats.sort_stats("tottime").print_stats(REPORT_LINES)
+        f.write("# sorted by cumulative\n")
+        stats.sort_stats("cumulative").print_stats(REPORT_LINES)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def run_sampler(exp, interval=0.001):
+    """interval 秒 (CPU 時間) ごとにスタックをとって collapsed 形式で書き出す"""
+    counts = collections.Counter()
+
+    def sample(signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(frame_name(frame))
+            frame = frame.f_back
+        counts[";".join(reversed(stack))] += 1
+
+    signal.signal(signal.SIGPROF, sample)
+    signal.setitimer(signal.ITIMER_PROF, interval, interval)
+    try:
+        exp.run()
+    finally:
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    with open(COLLAPSED_FNAME, "w") as f:
+        for stack, count in counts.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+if __name__ == "__main__":
+    # コマンドライン引数の処理
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--episodes", help="episodes to run", type=int, default=200)
+    parser.add_argument("--spec", help="run spec file (JSON or TOML)", metavar="FILE")
+    parser.add_argument("--collapsed", help="also write sampled collapsed stacks",
+                        action="store_true")
+    args = parser.parse_args()
+
+    run_cprofile(make_experiment(args.spec, args.episodes))
+    if args.collapsed:
+        run_sampler(make_experiment(args.spec, args.episodes))
@@ -0,0 +1,83 @@
+"""タイルコーディングで近くの状態の間で学習を共有する Agent
+
+Agent は状態を固定の格子 1 つで区切るので，隣のマスとの間で何も共有されない．
+TileCodingAgent は少しずつずらした tilings_num 枚の粗い格子 (tiling) を重ね，
+各 tiling で状態が入るタイルの重みの和を q-value とする．
+タイルの座標はまとめて計算して，大きさ memory_size の重みの配列にハッシュする．
+
+get_s_idx は状態の代わりにアクティブなタイルの index の配列 (shape = (tilings_num,)) を返すので，
+Experiment からは Agent と同じように action_idx / learn_idx で使える．
+"""
+
+import numpy as np
+
+import agent
+
+
+# 1 枚の tiling の各次元のタイル数 (Agent の分割数より粗くして重ねる)
+DEFAULT_TILES = {"x_num": 4, "theta_num": 20, "xdot_num": 5, "thetadot_num": 25}
+
+# タイルの座標をハッシュするときの係数 (tiling の番号, x, theta, xdot, thetadot)
+HASH_PRIMES = [2654435761, 40503, 2246822519, 3266489917, 668265263]
+
+
+class TileCodingAgent(agent.Agent):
+    # 重みはハッシュした (memory_size, actions) の配列なので，
+    # 状態 × 行動の表を前提にする policy, checkpoint, evaluate では使えない
+    backend = "tile"
+
+    def __init__(self, **params):
+        self.tilings_num = 4  # 重ねる tiling の数
+        self.memory_size = 1 << 16  # 重みの配列の行数 (タイルはここにハッシュされる)
+        super().__init__(**dict(DEFAULT_TILES, **params))
+
+        # x_num などは 1 枚の tiling の各次元のタイル数として使う
+        low = np.array([self.x_limits[0], self.theta_limits[0],
+                        self.xdot_limits[0], self.thetadot_limits[0]])
+        high = np.array([self.x_limits[1], self.theta_limits[1],
+                         self.xdot_limits[1], self.thetadot_limits[1]])
+        tiles = np.array([self.x_num, self.theta_num, self.xdot_num, self.thetadot_num])
+        self.scale = tiles / (high - low)  # 1 タイルの幅の逆数
+
+        # tiling t は次元 d 方向に t * (2d + 1) / tilings_num タイル分ずらす
+        t = np.arange(self.tilings_num)[:, np.newaxis]
+        d = np.arange(4)[np.newaxis, :]
+        offsets = (t * (2 * d + 1) / self.tilings_num) % 1.0
+        # タイルの座標は floor(s * scale + base)
+        self.base = offsets - low * self.scale
+
+        self.tiling_hash = np.arange(self.tilings_num, dtype=np.int64) * HASH_PRIMES[0]
+        self.coord_hash = np.array(HASH_PRIMES[1:], dtype=np.int64)
+
+    def get_s_idx(self, s):
+        """各 tiling で s が入るタイルの index"""
+        coords = np.floor(np.multiply(s, self.scale) + self.base).astype(np.int64)
+        return (coords @ self.coord_hash + self.tiling_hash) % self.memory_size
+
+    def qvalues(self, s_idx):
+        return self.qtable[s_idx].sum(axis=0)
+
+    def argmax(self, lst):
+        return int(lst.argmax())
+
+    def learn_idx(self, s_idx, a_idx, r, snext_idx):
+        weights = self.qtable
+        q = weights[s_idx, a_idx].sum()
+        target = r + self.gamma * weights[snext_idx].sum(axis=0).max()
+        # 学習率は tiling の数で割って，1 回の更新で q-value が alpha 分だけ動くようにする
+        weights[s_idx, a_idx] += self.alpha / self.tilings_num * (target - q)
+
+    def states_num(self):
+        return self.memory_size
+
+    def visited_states_num(self):
+        """一度でも learn した重みの行の数"""
+        return int(np.count_nonzero((self.qtable != self.init_weight).any(axis=1)))
+
+    def memory_bytes(self):
+        return self.qtable.nbytes
+
+    def make_qtable(self):
+        # q-value の初期値が init_qvalue になるように tiling の数で割っておく
+        self.init_weight = self.init_qvalue / self.tilings_num
+        return np.full((self.memory_size, len(self.actions)), self.init_weight)